@@ -3,26 +3,27 @@ Enhanced Flask Application with SQL Database Integration
 Supports multiple SQL databases and photo BLOB storage
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, abort
 from werkzeug.utils import secure_filename
+import click
 from datetime import datetime, date
 import os
 import json
 import secrets
 import hashlib
 import base64
-from io import BytesIO
 from PIL import Image
 import numpy as np
 import cv2
+from sqlalchemy.orm import selectinload, undefer
 
 # Import our enhanced configuration and models
 from database_config import get_config, test_database_connection, init_database
-from models_enhanced import db, Student, Attendance, DailyCode, PhotoMetadata, AttendanceSession
+from models_enhanced import db, Student, StudentPhoto, Attendance, AttendanceHistory, DailyCode, PhotoMetadata, AttendanceSession, attendance_between
 
 # Face recognition import (existing)
 try:
-    from mediapipe_face_recognition import MediaPipeFaceRecognition
+    from mediapipe_face_recognition import MediaPipeFaceRecognition, FaceDB, warmup
     FACE_RECOGNITION_AVAILABLE = True
     print("✅ MediaPipe Face Recognition loaded successfully!")
 except ImportError as e:
@@ -63,6 +64,7 @@ face_recognizer = None
 if FACE_RECOGNITION_AVAILABLE:
     try:
         face_recognizer = MediaPipeFaceRecognition()
+        warmup(face_recognizer.encoding_size)
     except Exception as e:
         print(f"⚠️  Face recognition initialization failed: {e}")
         FACE_RECOGNITION_AVAILABLE = False
@@ -138,7 +140,6 @@ def generate_daily_code():
         created_by='System',
         max_usage=1000
     )
-    daily_code_obj.generate_code_hash()
     
     db.session.add(daily_code_obj)
     db.session.commit()
@@ -168,16 +169,15 @@ def view_student(student_id):
 @app.route('/student_photo/<int:student_id>')
 def student_photo(student_id):
     """Serve student photo from database BLOB"""
-    student = Student.query.get_or_404(student_id)
+    has_photo = db.session.query(Student.has_photo).filter(Student.id == student_id).scalar()
+    if has_photo is None:
+        abort(404)
     
-    if not student.photo_blob:
+    if not has_photo:
         return redirect(url_for('static', filename='images/default_avatar.png'))
     
-    return send_file(
-        BytesIO(student.photo_blob),
-        mimetype='image/jpeg',
-        as_attachment=False
-    )
+    # Stream the BLOB in chunks instead of loading the whole photo into memory
+    return Response(StudentPhoto.open_photo_stream(student_id), mimetype='image/jpeg')
 
 @app.route('/add_student', methods=['GET', 'POST'])
 def add_student():
@@ -240,7 +240,7 @@ def add_student():
                             if faces:
                                 encoding = face_recognizer.generate_face_encoding(faces[0]['face_region'])
                                 if encoding is not None:
-                                    student.face_encoding = encoding.astype(np.float32).tobytes()
+                                    student.face_vector = encoding
                                     student.face_confidence = 0.8  # Initial confidence
                                     
                                     # Update metadata
@@ -336,7 +336,7 @@ def edit_student(student_id):
                                 if faces:
                                     face_encoding = face_recognizer.generate_face_encoding(faces[0]['face_region'])
                                     if face_encoding is not None:
-                                        student.face_encoding = face_encoding.astype(np.float32).tobytes()
+                                        student.face_vector = face_encoding
                                         flash('Photo and face encoding updated successfully!', 'success')
                                     else:
                                         flash('Photo updated but face encoding failed. Face recognition may not work optimally.', 'warning')
@@ -365,11 +365,15 @@ def edit_student(student_id):
 def delete_student(student_id):
     """Permanently delete student from database"""
     try:
-        student = Student.query.get_or_404(student_id)
-        student_name = student.name  # Store name before deletion
+        student_row = db.session.query(Student.name).filter(Student.id == student_id).first_or_404()
+        student_name = student_row.name  # Store name before deletion
         
-        # Delete the student (this will cascade delete attendance records and photo metadata)
-        db.session.delete(student)
+        # Delete dependent rows and the student with one bulk DELETE each,
+        # instead of loading and deleting every attendance/photo record through the ORM cascade
+        Attendance.query.filter(Attendance.student_id == student_id).delete(synchronize_session=False)
+        PhotoMetadata.query.filter(PhotoMetadata.student_id == student_id).delete(synchronize_session=False)
+        StudentPhoto.query.filter(StudentPhoto.student_id == student_id).delete(synchronize_session=False)
+        Student.query.filter(Student.id == student_id).delete(synchronize_session=False)
         db.session.commit()
         
         flash(f'Student {student_name} has been permanently deleted from the database!', 'success')
@@ -444,7 +448,7 @@ def detect_faces_live():
             })
         
         # Load all student encodings from database
-        students_with_encodings = Student.query.filter(
+        students_with_encodings = Student.query.options(undefer(Student.face_encoding)).filter(
             Student.face_encoding.isnot(None),
             Student.is_active == True
         ).all()
@@ -453,7 +457,7 @@ def detect_faces_live():
         
         for student in students_with_encodings:
             try:
-                encoding = np.frombuffer(student.face_encoding, dtype=np.float32)
+                encoding = student.face_vector
                 known_faces.append({
                     'id': student.id,
                     'name': student.name,
@@ -465,40 +469,45 @@ def detect_faces_live():
         
         # Identify faces using the correct method
         if known_faces:
-            results = face_recognizer.identify_faces(image, known_faces)
+            results = face_recognizer.identify_faces(image, FaceDB(known_faces))
             
             # Mark attendance for recognized faces
             today = date.today()
+            now = datetime.utcnow()
             marked_students = []
             
+            recognized = {}
             for result in results:
                 if result.get('identified') and result.get('student_info') and result.get('similarity', 0) > 0.6:
-                    # Get student info from result
-                    student_info = result['student_info']
-                    student_id = student_info['id']
-                    student_name = student_info['name']
-                    
-                    # Check if already marked today
-                    existing_attendance = Attendance.query.filter_by(
-                        student_id=student_id,
-                        date=today
-                    ).first()
-                    
-                    if not existing_attendance:
-                        # Mark attendance
-                        attendance = Attendance(
-                            student_id=student_id,
-                            date=today,
-                            time_in=datetime.utcnow(),
-                            status='Present',
-                            method='Camera',
-                            confidence=result.get('similarity', 0)
-                        )
-                        db.session.add(attendance)
-                        marked_students.append(student_name)
+                    # Keep one result per student (first one wins)
+                    recognized.setdefault(result['student_info']['id'], result)
             
-            if marked_students:
-                db.session.commit()
+            if recognized:
+                # Check which students are already marked today in one query
+                already_marked = {
+                    row.student_id for row in db.session.query(Attendance.student_id).filter(
+                        Attendance.date == today,
+                        Attendance.student_id.in_(recognized)
+                    )
+                }
+                
+                rows = []
+                for student_id, result in recognized.items():
+                    if student_id in already_marked:
+                        continue
+                    rows.append({
+                        'student_id': student_id,
+                        'date': today,
+                        'time_in': now,
+                        'status': 'Present',
+                        'method': 'Camera',
+                        'confidence': result.get('similarity', 0)
+                    })
+                    marked_students.append(result['student_info']['name'])
+                
+                if rows:
+                    Attendance.bulk_mark(rows)
+                    db.session.commit()
             
             # Format results for frontend
             face_data = []
@@ -547,37 +556,39 @@ def reports():
     student_filter = request.args.get('student_id')
     status_filter = request.args.get('status')
     
-    # Base query
-    query = Attendance.query.join(Student)
+    # Base query: (record, student) pairs over recent and archived attendance
+    query = db.session.query(AttendanceHistory, Student).join(
+        Student, Student.id == AttendanceHistory.student_id
+    )
     
     # Apply filters
     if selected_date:
         try:
             filter_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
-            query = query.filter(Attendance.date == filter_date)
+            query = query.filter(AttendanceHistory.date == filter_date)
         except ValueError:
             selected_date = None
     
     if student_filter:
         try:
             student_id = int(student_filter)
-            query = query.filter(Attendance.student_id == student_id)
+            query = query.filter(AttendanceHistory.student_id == student_id)
         except ValueError:
             student_filter = None
     
     if status_filter:
-        query = query.filter(Attendance.status == status_filter)
+        query = query.filter(AttendanceHistory.status == status_filter)
     
     # Get attendance records
-    attendance_records = query.order_by(Attendance.date.desc(), Attendance.created_at.desc()).all()
+    attendance_records = query.order_by(AttendanceHistory.date.desc(), AttendanceHistory.created_at.desc()).all()
     
     # Get all students for filter dropdown
     all_students = Student.query.filter(Student.is_active == True).order_by(Student.name).all()
     
     # Calculate statistics
     total_records = len(attendance_records)
-    present_count = sum(1 for record in attendance_records if record.status == 'Present')
-    absent_count = sum(1 for record in attendance_records if record.status == 'Absent')
+    present_count = sum(1 for record, _ in attendance_records if record.status == 'Present')
+    absent_count = sum(1 for record, _ in attendance_records if record.status == 'Absent')
     
     # Get today's attendance summary
     today = date.today()
@@ -587,9 +598,8 @@ def reports():
     
     # Get weekly summary
     week_start = today - timedelta(days=today.weekday())
-    weekly_attendance = Attendance.query.filter(
-        Attendance.date >= week_start,
-        Attendance.date <= today
+    weekly_attendance = AttendanceHistory.query.filter(
+        attendance_between(week_start, today + timedelta(days=1), AttendanceHistory)
     ).all()
     
     weekly_stats = {}
@@ -640,6 +650,46 @@ def admin_database():
                          recent_students=recent_students,
                          recent_attendance=recent_attendance)
 
+@app.route('/admin/repair_photos', methods=['POST'])
+def repair_photos():
+    """Verify every stored photo against its hash and fill in missing hashes"""
+    from models_enhanced import batch_verify_photos
+    try:
+        student_ids = [row[0] for row in db.session.query(StudentPhoto.student_id).filter(
+            StudentPhoto.photo_blob.isnot(None)
+        ).all()]
+        
+        verified, repaired, corrupted = 0, 0, []
+        # A page of photos at a time, so only that many BLOBs are held in memory
+        for i in range(0, len(student_ids), 200):
+            students = Student.query.options(
+                selectinload(Student.photo).undefer(StudentPhoto.photo_blob)
+            ).filter(Student.id.in_(student_ids[i:i + 200])).all()
+            
+            for student, ok in zip(students, batch_verify_photos(students)):
+                if ok:
+                    verified += 1
+                elif student.photo.photo_hash is None:
+                    student.photo.photo_hash = hashlib.sha256(student.photo.photo_blob).hexdigest()
+                    repaired += 1
+                else:
+                    corrupted.append(student.id)
+            db.session.commit()
+        
+        return jsonify({'success': True, 'verified': verified, 'repaired': repaired, 'corrupted': corrupted})
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.cli.command('archive-attendance')
+@click.option('--days', default=90, show_default=True, help='Days of attendance to keep in the attendance table')
+def archive_attendance_command(days):
+    """Move older attendance records into attendance_archive (run from cron)"""
+    from models_enhanced import archive_old_attendance
+    moved = archive_old_attendance(hot_days=days)
+    print(f"📦 Archived {moved} attendance records older than {days} days")
+
 @app.route('/api/students')
 def api_students():
     """API endpoint to get all active students"""
@@ -681,8 +731,7 @@ def mark_attendance_auto():
     
     # Verify daily code
     daily_code = DailyCode.query.filter_by(
-        date=date.today(),
-        code=code,
+        code_hash=DailyCode.hash_code(code, date.today()),
         is_active=True
     ).first()
     
@@ -734,8 +783,7 @@ def manual_attendance():
     
     # Verify daily code
     daily_code = DailyCode.query.filter_by(
-        date=date.today(),
-        code=code,
+        code_hash=DailyCode.hash_code(code, date.today()),
         is_active=True
     ).first()
     
@@ -778,7 +826,10 @@ def manual_attendance():
 @app.route('/api/students_with_encodings')
 def api_students_with_encodings():
     """API endpoint to get all active students with face encodings"""
-    students = Student.query.filter(Student.is_active == True).order_by(Student.name).all()
+    # Encodings are deferred; load them with the students instead of one query each
+    students = Student.query.options(undefer(Student.face_encoding)).filter(
+        Student.is_active == True
+    ).order_by(Student.name).all()
     
     students_data = []
     for student in students:
@@ -787,11 +838,11 @@ def api_students_with_encodings():
             'name': student.name,
             'roll_number': student.roll_number,
             'class_name': student.class_name,
-            'has_photo': student.photo_blob is not None
+            'has_photo': student.has_photo
         }
         
         # Generate face encoding if not exists and photo is available
-        if student.photo_blob and not student.face_encoding:
+        if student.has_photo and not student.has_face_encoding:
             try:
                 # Generate face encoding from photo
                 if FACE_RECOGNITION_AVAILABLE:
@@ -808,17 +859,17 @@ def api_students_with_encodings():
                     if faces:
                         encoding = face_rec.generate_face_encoding(faces[0]['face_region'])
                         if encoding is not None:
-                            # Store encoding in database
-                            student.face_encoding = encoding.tobytes()
+                            # Store encoding in database (raw float32 bytes)
+                            student.face_vector = encoding
                             db.session.commit()
                             student_data['encoding'] = encoding.tolist()
             except Exception as e:
                 print(f"Error generating encoding for {student.name}: {e}")
         
-        elif student.face_encoding:
+        elif student.has_face_encoding:
             # Load existing encoding
             try:
-                encoding_array = np.frombuffer(student.face_encoding, dtype=np.float32)
+                encoding_array = student.face_vector
                 student_data['encoding'] = encoding_array.tolist()
             except Exception as e:
                 print(f"Error loading encoding for {student.name}: {e}")
@@ -890,7 +941,7 @@ def detect_and_identify_faces():
         except Exception as e:
             print(f"❌ Raw SQL query failed: {e}")
             # Fallback to SQLAlchemy
-            students = Student.query.filter(
+            students = Student.query.options(undefer(Student.face_encoding)).filter(
                 Student.is_active == True,
                 Student.face_encoding.isnot(None)
             ).all()
@@ -911,7 +962,7 @@ def detect_and_identify_faces():
                         'encoding': encoding
                     })
                 else:
-                    encoding = np.frombuffer(student.face_encoding, dtype=np.float32)
+                    encoding = student.face_vector
                     known_faces.append({
                         'id': student.id,
                         'name': student.name,
@@ -929,7 +980,7 @@ def detect_and_identify_faces():
         for kf in known_faces:
             print(f"   - {kf['name']} ({kf['roll_number']}) - Encoding shape: {kf['encoding'].shape}")
         
-        identified_faces = face_rec.identify_faces(image, known_faces)
+        identified_faces = face_rec.identify_faces(image, FaceDB(known_faces))
         print(f"🔍 MediaPipe returned {len(identified_faces)} identified faces")
         
         # Debug each face result
@@ -1,10 +1,29 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import delete, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, date
 import os
 import json
+import sqlite3
 import hashlib
 import secrets
+from functools import lru_cache
+from io import BytesIO
+import base64
+
+try:
+    import qrcode
+    QR_AVAILABLE = True
+except ImportError:
+    QR_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
@@ -17,6 +36,14 @@ if not os.path.exists('static/uploads'):
 
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores foreign keys (and ON DELETE CASCADE) unless enabled per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 # Database Models
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -29,11 +56,11 @@ class Student(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship with attendance records
-    attendance_records = db.relationship('Attendance', backref='student', lazy=True)
+    attendance_records = db.relationship('Attendance', backref='student', lazy=True, passive_deletes=True)
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=date.today)
     time_in = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     method = db.Column(db.String(20), nullable=False, default='Manual')  # Manual, Camera, QR_Mobile
@@ -41,7 +68,11 @@ class Attendance(db.Model):
     verification_code = db.Column(db.String(10), nullable=True)  # For manual verification
     
     # Ensure one attendance record per student per day
-    __table_args__ = (db.UniqueConstraint('student_id', 'date', name='unique_attendance'),)
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'date', name='unique_attendance'),
+        # Daily reports filter by date and join on student
+        db.Index('idx_attendance_date_student', 'date', 'student_id'),
+    )
 
 class DailyCode(db.Model):
     """Daily changing codes for secure attendance"""
@@ -50,22 +81,51 @@ class DailyCode(db.Model):
     daily_code = db.Column(db.String(10), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-def generate_daily_code():
-    """Generate a new daily code for attendance verification"""
-    today = date.today()
-    existing_code = DailyCode.query.filter_by(date=today).first()
+def json_response(payload):
+    """Serialize a JSON API response, using orjson when it is installed"""
+    if ORJSON_AVAILABLE:
+        return Response(orjson.dumps(payload), mimetype='application/json')
+    return jsonify(payload)
+
+def generate_secure_token(roll_number, name):
+    """Generate a student's secure QR token from their details and random salt"""
+    token_hash = hashlib.sha256(roll_number.encode())
+    token_hash.update(name.encode())
+    token_hash.update(secrets.token_bytes(16))
+    return token_hash.hexdigest()[:16]
+
+# (date, isoformat) pair for today, refreshed when the date rolls over
+_TODAY_ISO = (None, None)
+
+def today_iso(today=None):
+    """Return today's date as an ISO string, cached until the date changes"""
+    global _TODAY_ISO
+    today = today or date.today()
+    if _TODAY_ISO[0] != today:
+        _TODAY_ISO = (today, today.isoformat())
+    return _TODAY_ISO[1]
+
+def generate_daily_code(today=None):
+    """Get today's DailyCode, creating it if it does not exist yet"""
+    today = today or date.today()
+    daily_code_obj = DailyCode.query.filter_by(date=today).first()
     
-    if existing_code:
-        return existing_code.daily_code
+    if daily_code_obj:
+        return daily_code_obj
     
     # Generate a new 6-digit code
     new_code = str(secrets.randbelow(900000) + 100000)
     
     daily_code_obj = DailyCode(date=today, daily_code=new_code)
     db.session.add(daily_code_obj)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request created today's code first
+        db.session.rollback()
+        daily_code_obj = DailyCode.query.filter_by(date=today).first()
     
-    return new_code
+    return daily_code_obj
 
 # Routes
 @app.route('/')
@@ -92,7 +152,7 @@ def add_student():
             return render_template('add_student_secure.html')
         
         # Generate secure token for this student
-        secure_token = hashlib.sha256(f"{roll_number}{name}{secrets.token_hex(16)}".encode()).hexdigest()[:16]
+        secure_token = generate_secure_token(roll_number, name)
         
         # Handle optional photo upload
         photo_path = None
@@ -125,13 +185,7 @@ def add_student():
 @app.route('/attendance')
 def attendance_page():
     # Get today's daily code object
-    today = date.today()
-    daily_code = DailyCode.query.filter_by(date=today).first()
-    
-    if not daily_code:
-        # Generate daily code if it doesn't exist
-        code_string = generate_daily_code()  # This creates the DailyCode object
-        daily_code = DailyCode.query.filter_by(date=today).first()  # Get the created object
+    daily_code = generate_daily_code()
     
     return render_template('attendance_secure.html', daily_code=daily_code)
 
@@ -147,11 +201,7 @@ def manual_attendance():
     marked_ids = [item[0] for item in marked_students]
     
     # Get today's daily code object
-    daily_code = DailyCode.query.filter_by(date=today).first()
-    if not daily_code:
-        # Generate daily code if it doesn't exist
-        code_string = generate_daily_code()  # This creates the DailyCode object
-        daily_code = DailyCode.query.filter_by(date=today).first()  # Get the created object
+    daily_code = generate_daily_code(today)
     
     return render_template('manual_attendance_secure.html', 
                          students=students, 
@@ -162,30 +212,33 @@ def manual_attendance():
 @app.route('/mark_manual_attendance', methods=['POST'])
 def mark_manual_attendance():
     try:
-        student_ids = request.form.getlist('student_ids')
+        student_ids = [int(student_id) for student_id in request.form.getlist('student_ids')]
+        now = datetime.utcnow()
         today = date.today()
         
+        # One query to validate the submitted IDs, one for today's existing marks
+        valid_ids = {row[0] for row in db.session.query(Student.id).filter(
+            Student.id.in_(student_ids)
+        ).all()}
+        already_marked = {row[0] for row in db.session.query(Attendance.student_id).filter(
+            Attendance.date == today,
+            Attendance.student_id.in_(valid_ids)
+        ).all()}
+        
         marked_count = 0
         
         for student_id in student_ids:
-            student = Student.query.get(int(student_id))
-            if student:
-                # Check if already marked
-                existing = Attendance.query.filter_by(
-                    student_id=student.id,
-                    date=today
-                ).first()
-                
-                if not existing:
-                    attendance = Attendance(
-                        student_id=student.id,
-                        date=today,
-                        time_in=datetime.utcnow(),
-                        method='Manual',
-                        status='Present'
-                    )
-                    db.session.add(attendance)
-                    marked_count += 1
+            if student_id in valid_ids and student_id not in already_marked:
+                attendance = Attendance(
+                    student_id=student_id,
+                    date=today,
+                    time_in=now,
+                    method='Manual',
+                    status='Present'
+                )
+                db.session.add(attendance)
+                already_marked.add(student_id)
+                marked_count += 1
         
         db.session.commit()
         flash(f'Attendance marked for {marked_count} students!', 'success')
@@ -198,7 +251,7 @@ def mark_manual_attendance():
 @app.route('/attendance/mobile')
 def mobile_attendance():
     """Mobile-based attendance for teachers with smartphones"""
-    daily_code = generate_daily_code()
+    daily_code = generate_daily_code().daily_code
     students = Student.query.all()
     return render_template('mobile_attendance.html', students=students, daily_code=daily_code)
 
@@ -207,20 +260,21 @@ def mark_mobile_attendance():
     try:
         student_id = request.json.get('student_id')
         verification_code = request.json.get('verification_code', '').strip()
+        now = datetime.utcnow()
+        today = date.today()
         
         if not student_id:
-            return jsonify({'success': False, 'message': 'No student selected'})
+            return json_response({'success': False, 'message': 'No student selected'})
         
         # Verify daily code
-        today = date.today()
         daily_code_obj = DailyCode.query.filter_by(date=today).first()
         
         if not daily_code_obj or verification_code != daily_code_obj.daily_code:
-            return jsonify({'success': False, 'message': 'Invalid verification code'})
+            return json_response({'success': False, 'message': 'Invalid verification code'})
         
         student = Student.query.get(int(student_id))
         if not student:
-            return jsonify({'success': False, 'message': 'Student not found'})
+            return json_response({'success': False, 'message': 'Student not found'})
         
         # Check if already marked today
         existing = Attendance.query.filter_by(
@@ -229,7 +283,7 @@ def mark_mobile_attendance():
         ).first()
         
         if existing:
-            return jsonify({
+            return json_response({
                 'success': False, 
                 'message': f'{student.name} already marked attendance today'
             })
@@ -238,7 +292,7 @@ def mark_mobile_attendance():
         attendance = Attendance(
             student_id=student.id,
             date=today,
-            time_in=datetime.utcnow(),
+            time_in=now,
             method='Mobile',
             status='Present',
             verification_code=verification_code
@@ -247,92 +301,92 @@ def mark_mobile_attendance():
         db.session.add(attendance)
         db.session.commit()
         
-        return jsonify({
+        return json_response({
             'success': True,
             'message': f'Attendance marked for {student.name}',
             'student': {
                 'name': student.name,
                 'roll_number': student.roll_number,
-                'time': datetime.utcnow().strftime('%I:%M %p')
+                'time': now.strftime('%I:%M %p')
             }
         })
         
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+        return json_response({'success': False, 'message': f'Error: {str(e)}'})
 
 @app.route('/attendance/qr')
 def qr_attendance():
     """QR code based attendance with daily verification"""
-    daily_code = generate_daily_code()
+    daily_code = generate_daily_code().daily_code
     students = Student.query.all()
     return render_template('qr_attendance_secure.html', students=students, daily_code=daily_code)
 
+# QR data embeds today's date, so yesterday's entries are never hit again
+@lru_cache(maxsize=2048)
+def build_qr_image(qr_data):
+    """Render QR data to a base64-encoded PNG string"""
+    # Generate QR code
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    
+    img = qr.make_image(fill_color="black", back_color="white")
+    
+    # Convert to base64 for display
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
 @app.route('/generate_daily_qr/<int:student_id>')
 def generate_daily_qr(student_id):
     """Generate a daily QR code for a student"""
+    if not QR_AVAILABLE:
+        return json_response({
+            'success': False,
+            'message': 'QR code library not installed. Run: pip install qrcode[pil]'
+        })
+    
     student = Student.query.get_or_404(student_id)
-    daily_code = generate_daily_code()
+    daily_code = generate_daily_code().daily_code
     
     # Create secure QR data with daily code and student token
-    qr_data = f"ATTEND:{date.today().isoformat()}:{student.secure_token}:{daily_code}:{student.roll_number}"
+    qr_data = f"ATTEND:{today_iso()}:{student.secure_token}:{daily_code}:{student.roll_number}"
+    img_str = build_qr_image(qr_data)
     
-    try:
-        import qrcode
-        from io import BytesIO
-        import base64
-        
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64 for display
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return jsonify({
-            'success': True,
-            'qr_image': f"data:image/png;base64,{img_str}",
-            'student_name': student.name,
-            'roll_number': student.roll_number,
-            'valid_until': 'End of day',
-            'security_note': 'QR code changes daily and is unique to each student'
-        })
-        
-    except ImportError:
-        return jsonify({
-            'success': False,
-            'message': 'QR code library not installed. Run: pip install qrcode[pil]'
-        })
+    return json_response({
+        'success': True,
+        'qr_image': f"data:image/png;base64,{img_str}",
+        'student_name': student.name,
+        'roll_number': student.roll_number,
+        'valid_until': 'End of day',
+        'security_note': 'QR code changes daily and is unique to each student'
+    })
 
 @app.route('/scan_qr_attendance', methods=['POST'])
 def scan_qr_attendance():
     """Process scanned QR code for attendance"""
     try:
         qr_data = request.json.get('qr_data', '').strip()
-        
-        if not qr_data.startswith('ATTEND:'):
-            return jsonify({'success': False, 'message': 'Invalid QR code format'})
+        now = datetime.utcnow()
+        today = date.today()
         
         # Parse QR data: ATTEND:date:token:daily_code:roll_number
-        parts = qr_data.split(':')
-        if len(parts) != 5:
-            return jsonify({'success': False, 'message': 'Invalid QR code structure'})
+        parts = qr_data.split(':', 4)
+        if parts[0] != 'ATTEND':
+            return json_response({'success': False, 'message': 'Invalid QR code format'})
+        if len(parts) != 5 or ':' in parts[4]:
+            return json_response({'success': False, 'message': 'Invalid QR code structure'})
         
-        qr_date, student_token, qr_daily_code, roll_number = parts[1], parts[2], parts[3], parts[4]
+        _, qr_date, student_token, qr_daily_code, roll_number = parts
         
         # Verify date (must be today)
-        if qr_date != date.today().isoformat():
-            return jsonify({'success': False, 'message': 'QR code expired (not for today)'})
+        if qr_date != today_iso(today):
+            return json_response({'success': False, 'message': 'QR code expired (not for today)'})
         
         # Verify daily code
-        today = date.today()
         daily_code_obj = DailyCode.query.filter_by(date=today).first()
         if not daily_code_obj or qr_daily_code != daily_code_obj.daily_code:
-            return jsonify({'success': False, 'message': 'Invalid or expired daily code'})
+            return json_response({'success': False, 'message': 'Invalid or expired daily code'})
         
         # Find student by token and roll number
         student = Student.query.filter_by(
@@ -341,7 +395,7 @@ def scan_qr_attendance():
         ).first()
         
         if not student:
-            return jsonify({'success': False, 'message': 'Student not found or invalid token'})
+            return json_response({'success': False, 'message': 'Student not found or invalid token'})
         
         # Check if already marked today
         existing = Attendance.query.filter_by(
@@ -350,7 +404,7 @@ def scan_qr_attendance():
         ).first()
         
         if existing:
-            return jsonify({
+            return json_response({
                 'success': False, 
                 'message': f'{student.name} already marked attendance today'
             })
@@ -359,7 +413,7 @@ def scan_qr_attendance():
         attendance = Attendance(
             student_id=student.id,
             date=today,
-            time_in=datetime.utcnow(),
+            time_in=now,
             method='QR_Secure',
             status='Present',
             verification_code=qr_daily_code
@@ -368,18 +422,18 @@ def scan_qr_attendance():
         db.session.add(attendance)
         db.session.commit()
         
-        return jsonify({
+        return json_response({
             'success': True,
             'message': f'Attendance marked for {student.name}',
             'student': {
                 'name': student.name,
                 'roll_number': student.roll_number,
-                'time': datetime.utcnow().strftime('%I:%M %p')
+                'time': now.strftime('%I:%M %p')
             }
         })
         
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Error processing QR code: {str(e)}'})
+        return json_response({'success': False, 'message': f'Error processing QR code: {str(e)}'})
 
 @app.route('/reports')
 def reports():
@@ -426,8 +480,8 @@ def reports_by_date(date_str):
 @app.route('/get_daily_code')
 def get_daily_code():
     """API endpoint to get today's daily code for teachers"""
-    daily_code = generate_daily_code()
-    return jsonify({'daily_code': daily_code, 'date': date.today().isoformat()})
+    daily_code = generate_daily_code().daily_code
+    return json_response({'daily_code': daily_code, 'date': date.today().isoformat()})
 
 @app.route('/delete_student', methods=['POST'])
 def delete_student():
@@ -437,40 +491,41 @@ def delete_student():
         student_id = data.get('student_id')
         
         if not student_id:
-            return jsonify({'success': False, 'message': 'Student ID is required'})
+            return json_response({'success': False, 'message': 'Student ID is required'})
         
         # Find the student
-        student = Student.query.get(student_id)
+        student = db.session.query(Student.name, Student.photo_path).filter(
+            Student.id == student_id
+        ).first()
         if not student:
-            return jsonify({'success': False, 'message': 'Student not found'})
-        
-        student_name = student.name
-        photo_path = student.photo_path
+            return json_response({'success': False, 'message': 'Student not found'})
         
-        # Delete attendance records first (foreign key constraint)
-        Attendance.query.filter_by(student_id=student_id).delete()
+        student_name, photo_path = student
         
-        # Delete the student
-        db.session.delete(student)
+        # Delete attendance first: databases created before ON DELETE CASCADE
+        # keep the old foreign key and would reject the student delete
+        db.session.execute(delete(Attendance).where(Attendance.student_id == student_id))
+        db.session.execute(delete(Student).where(Student.id == student_id))
         db.session.commit()
         
         # Clean up photo file
         if photo_path:
             full_path = os.path.join("static", photo_path.lstrip('/'))
-            if os.path.exists(full_path):
-                try:
-                    os.remove(full_path)
-                except Exception as e:
-                    print(f"Error removing photo file: {e}")
-        
-        return jsonify({
+            try:
+                os.unlink(full_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing photo file: {e}")
+        
+        return json_response({
             'success': True, 
             'message': f'Student {student_name} deleted successfully'
         })
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'Error deleting student: {str(e)}'})
+        return json_response({'success': False, 'message': f'Error deleting student: {str(e)}'})
 
 @app.route('/delete_all_students', methods=['POST'])
 def delete_all_students():
@@ -481,39 +536,38 @@ def delete_all_students():
         attendance_count = Attendance.query.count()
         
         if student_count == 0:
-            return jsonify({'success': True, 'message': 'No students to delete'})
+            return json_response({'success': True, 'message': 'No students to delete'})
         
         # Get all photo paths before deletion
-        students = Student.query.all()
-        photo_paths = [student.photo_path for student in students if student.photo_path]
-        
-        # Delete all attendance records first
-        Attendance.query.delete()
-        
-        # Delete all students
-        Student.query.delete()
+        photo_paths = [row[0] for row in db.session.query(Student.photo_path).filter(
+            Student.photo_path.isnot(None)
+        ).all()]
         
+        # Delete all attendance first (see delete_student), then all students
+        db.session.execute(delete(Attendance))
+        db.session.execute(delete(Student))
         db.session.commit()
         
         # Clean up photo files
         removed_photos = 0
         for photo_path in photo_paths:
             full_path = os.path.join("static", photo_path.lstrip('/'))
-            if os.path.exists(full_path):
-                try:
-                    os.remove(full_path)
-                    removed_photos += 1
-                except Exception as e:
-                    print(f"Error removing photo file {photo_path}: {e}")
-        
-        return jsonify({
+            try:
+                os.unlink(full_path)
+                removed_photos += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing photo file {photo_path}: {e}")
+        
+        return json_response({
             'success': True,
             'message': f'Successfully deleted {student_count} students, {attendance_count} attendance records, and {removed_photos} photos'
         })
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'Error deleting students: {str(e)}'})
+        return json_response({'success': False, 'message': f'Error deleting students: {str(e)}'})
 
 @app.route('/export_students')
 def export_students():
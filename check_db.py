@@ -1,45 +1,106 @@
+#!/usr/bin/env python3
+"""
+Check database tables, structure and students with their face encodings
+"""
+
 import sqlite3
+import json
+import os
+import numpy as np
+
+def print_tables(cursor):
+    """Print every table with its columns and row count"""
+    tables = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table'"
+    ).fetchall()]
+
+    print(f"📋 Tables found: {len(tables)}")
+
+    for table_name in tables:
+        print(f"\n🔍 Table: {table_name}")
+
+        # Get table schema
+        columns = cursor.execute(f"PRAGMA table_info({table_name})").fetchall()
+        print("   Columns:")
+        for col in columns:
+            print(f"     - {col[1]} ({col[2]})")
+
+        # Get row count
+        count = cursor.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        print(f"   Rows: {count}")
+
+    return tables
+
+def decode_encoding(face_encoding):
+    """Decode a stored face encoding into a numpy array"""
+    # The enhanced app stores raw float32 bytes: decode without copying
+    if isinstance(face_encoding, bytes):
+        return np.frombuffer(face_encoding, dtype=np.float32)
+
+    # Older databases store a JSON list of floats
+    encoding_data = json.loads(face_encoding)
+    if not isinstance(encoding_data, list):
+        raise ValueError(f"Invalid face encoding format: {type(encoding_data)}")
+    return np.asarray(encoding_data, dtype=np.float64)
+
+def print_students(cursor):
+    """Print all students and their face encodings"""
+    # Note: table name is 'student', not 'students'
+    rows = cursor.execute(
+        'SELECT id, name, email, phone, photo_filename, face_encoding FROM student'
+    ).fetchall()
+
+    print(f"\n📊 Total students in database: {len(rows)}")
+    print("-" * 60)
 
-# Connect to database
-conn = sqlite3.connect('attendance_enhanced.db')
-cursor = conn.cursor()
-
-# Check what tables exist
-print("=== TABLES IN DATABASE ===")
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-tables = cursor.fetchall()
-for table in tables:
-    print(f"Table: {table[0]}")
-
-if not tables:
-    print("No tables found!")
-    conn.close()
-    exit()
-
-# Check if student table exists (could be 'student' or 'students')
-table_name = None
-for table in tables:
-    if 'student' in table[0].lower():
-        table_name = table[0]
-        break
-
-if table_name:
-    print(f"\n=== STUDENTS IN TABLE '{table_name}' ===")
-    cursor.execute(f'SELECT * FROM {table_name} LIMIT 5')
-    rows = cursor.fetchall()
-    
-    # Get column names
-    cursor.execute(f'PRAGMA table_info({table_name})')
-    columns = cursor.fetchall()
-    column_names = [col[1] for col in columns]
-    print(f"Columns: {column_names}")
-    
     for row in rows:
-        print(f"Row: {row}")
-    
-    print(f"\nTotal rows in {table_name}: ", end="")
-    cursor.execute(f'SELECT COUNT(*) FROM {table_name}')
-    count = cursor.fetchone()[0]
-    print(count)
-
-conn.close()
\ No newline at end of file
+        student_id, name, email, phone, photo_filename, face_encoding = row
+        print(f"👤 Student ID: {student_id}")
+        print(f"   Name: {name}")
+        print(f"   Email: {email}")
+        print(f"   Phone: {phone}")
+        print(f"   Photo: {photo_filename}")
+
+        if face_encoding:
+            try:
+                encoding_array = decode_encoding(face_encoding)
+                print(f"   ✅ Face Encoding: {len(encoding_array)} features")
+                print(f"   🔢 Encoding sample: {encoding_array[:5]}...")
+            except json.JSONDecodeError as e:
+                print(f"   ❌ Face encoding JSON error: {e}")
+            except Exception as e:
+                print(f"   ❌ Face encoding error: {e}")
+        else:
+            print(f"   ❌ No face encoding")
+
+        print("-" * 60)
+
+def inspect(db_path='attendance_enhanced.db'):
+    """Inspect the database in a single connection and read transaction"""
+    if not os.path.exists(db_path):
+        print(f"❌ Database file '{db_path}' does not exist")
+        return
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+
+        # Keep every read below in one transaction so the shared lock is
+        # acquired once instead of per statement
+        cursor.execute("BEGIN")
+
+        print(f"📊 Database: {db_path}")
+        tables = print_tables(cursor)
+
+        if 'student' in tables:
+            print_students(cursor)
+
+        cursor.execute("COMMIT")
+
+    except Exception as e:
+        print(f"❌ Database error: {e}")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    inspect()
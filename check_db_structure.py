@@ -1,51 +0,0 @@
-#!/usr/bin/env python3
-"""
-Check database tables and structure
-"""
-
-import sqlite3
-import os
-
-def check_database():
-    """Check database structure"""
-    db_path = 'attendance_enhanced.db'
-    
-    if not os.path.exists(db_path):
-        print(f"❌ Database file '{db_path}' does not exist")
-        return
-    
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        print(f"📊 Database: {db_path}")
-        print(f"📋 Tables found: {len(tables)}")
-        
-        for table in tables:
-            table_name = table[0]
-            print(f"\n🔍 Table: {table_name}")
-            
-            # Get table schema
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            
-            print("   Columns:")
-            for col in columns:
-                print(f"     - {col[1]} ({col[2]})")
-            
-            # Get row count
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
-            print(f"   Rows: {count}")
-        
-        conn.close()
-        
-    except Exception as e:
-        print(f"❌ Database error: {e}")
-
-if __name__ == '__main__':
-    check_database()
\ No newline at end of file
@@ -8,13 +8,47 @@ Student Management Script
 
 import os
 import sys
+from collections import defaultdict
 from pathlib import Path
 
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from sqlalchemy import text
+
 from app_secure_rural import app, db, Student, Attendance
 
+def remove_photo_files(photo_paths):
+    """Remove photo files with one directory scan per folder instead of a stat per file"""
+    # Group the files to delete by directory: {directory: {file name: photo_path}}
+    by_dir = defaultdict(dict)
+    for photo_path in photo_paths:
+        full_path = os.path.join("static", photo_path.lstrip('/'))
+        by_dir[os.path.dirname(full_path)][os.path.basename(full_path)] = photo_path
+    
+    removed_photos = 0
+    for directory, targets in by_dir.items():
+        try:
+            with os.scandir(directory or '.') as entries:
+                for entry in entries:
+                    photo_path = targets.pop(entry.name, None)
+                    if photo_path is None:
+                        continue
+                    try:
+                        os.unlink(entry.path)
+                        removed_photos += 1
+                        print(f"   - Removed: {photo_path}")
+                    except Exception as e:
+                        print(f"   - Error removing {photo_path}: {e}")
+        except FileNotFoundError:
+            pass
+        
+        # Anything not seen during the scan does not exist on disk
+        for photo_path in targets.values():
+            print(f"   - File not found: {photo_path}")
+    
+    return removed_photos
+
 def remove_all_students():
     """Remove all student profiles and their data"""
     print("🗑️  Starting Student Profile Cleanup...")
@@ -22,9 +56,10 @@ def remove_all_students():
     
     with app.app_context():
         try:
-            # Count existing data
-            student_count = Student.query.count()
-            attendance_count = Attendance.query.count()
+            # Count existing data in a single round-trip
+            student_count, attendance_count = db.session.execute(text(
+                "SELECT (SELECT COUNT(*) FROM student), (SELECT COUNT(*) FROM attendance)"
+            )).one()
             
             print(f"📊 Current Database Status:")
             print(f"   - Students: {student_count}")
@@ -34,41 +69,32 @@ def remove_all_students():
                 print("✅ Database is already clean!")
                 return
             
-            # Remove all attendance records first (foreign key constraint)
+            # Remove all attendance records first (foreign key constraint).
+            # Both deletes share one transaction and are committed together below.
             print(f"\n🗑️  Removing {attendance_count} attendance records...")
-            Attendance.query.delete()
-            db.session.commit()
-            print("✅ All attendance records removed")
+            db.session.execute(Attendance.__table__.delete())
             
-            # Get student photo paths before deletion
-            students = Student.query.all()
+            # Get student photo paths before deletion (columns only, no ORM objects)
+            students = db.session.query(
+                Student.name, Student.roll_number, Student.photo_path
+            ).all()
             photo_paths = []
             
             print(f"\n🗑️  Removing {student_count} student profiles...")
-            for student in students:
-                if student.photo_path:
-                    photo_paths.append(student.photo_path)
-                print(f"   - Removing: {student.name} ({student.roll_number})")
+            for name, roll_number, photo_path in students:
+                if photo_path:
+                    photo_paths.append(photo_path)
+                print(f"   - Removing: {name} ({roll_number})")
             
             # Remove all students
-            Student.query.delete()
+            db.session.execute(Student.__table__.delete())
             db.session.commit()
+            print("✅ All attendance records removed")
             print("✅ All student profiles removed")
             
             # Clean up photo files
             print(f"\n🗑️  Cleaning up {len(photo_paths)} photo files...")
-            removed_photos = 0
-            for photo_path in photo_paths:
-                full_path = os.path.join("static", photo_path.lstrip('/'))
-                if os.path.exists(full_path):
-                    try:
-                        os.remove(full_path)
-                        removed_photos += 1
-                        print(f"   - Removed: {photo_path}")
-                    except Exception as e:
-                        print(f"   - Error removing {photo_path}: {e}")
-                else:
-                    print(f"   - File not found: {photo_path}")
+            removed_photos = remove_photo_files(photo_paths)
             
             print(f"✅ Removed {removed_photos} photo files")
             
@@ -76,16 +102,15 @@ def remove_all_students():
             uploads_dir = "static/uploads"
             if os.path.exists(uploads_dir):
                 try:
-                    # Remove empty subdirectories
-                    for root, dirs, files in os.walk(uploads_dir, topdown=False):
-                        for directory in dirs:
-                            dir_path = os.path.join(root, directory)
-                            try:
-                                if not os.listdir(dir_path):  # Directory is empty
-                                    os.rmdir(dir_path)
-                                    print(f"   - Removed empty directory: {dir_path}")
-                            except OSError:
-                                pass  # Directory not empty or other error
+                    # Remove empty subdirectories (uploads is flat, one level is enough)
+                    with os.scandir(uploads_dir) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                try:
+                                    os.rmdir(entry.path)
+                                    print(f"   - Removed empty directory: {entry.path}")
+                                except OSError:
+                                    pass  # Directory not empty or other error
                 except Exception as e:
                     print(f"   - Error cleaning directories: {e}")
             
@@ -119,21 +144,28 @@ def list_current_students():
     print("=" * 50)
     
     with app.app_context():
-        students = Student.query.all()
+        students = db.session.query(
+            Student.name, Student.roll_number, Student.parent_name,
+            Student.phone_number, Student.created_at, Student.secure_token
+        ).all()
         
         if not students:
             print("   No students found in database")
             return
         
+        # Build the whole listing and write it out once
+        lines = []
         for i, student in enumerate(students, 1):
-            print(f"{i}. {student.name}")
-            print(f"   Roll Number: {student.roll_number}")
-            print(f"   Parent: {student.parent_name}")
-            print(f"   Phone: {student.phone_number}")
-            print(f"   Registered: {student.created_at.strftime('%d %b %Y')}")
+            lines.append(f"{i}. {student.name}")
+            lines.append(f"   Roll Number: {student.roll_number}")
+            lines.append(f"   Parent: {student.parent_name}")
+            lines.append(f"   Phone: {student.phone_number}")
+            lines.append(f"   Registered: {student.created_at.strftime('%d %b %Y')}")
             if student.secure_token:
-                print(f"   Secure Token: {student.secure_token[:10]}...")
-            print()
+                lines.append(f"   Secure Token: {student.secure_token[:10]}...")
+            lines.append("")
+        
+        sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     print("🎓 Student Management System")
@@ -42,26 +42,34 @@ def create_sample_students():
         
         print("Creating sample students...")
         
+        # Look up all existing roll numbers in one query
+        existing_rolls = {roll for (roll,) in db.session.query(Student.roll_number).filter(
+            Student.roll_number.in_([s['roll_number'] for s in sample_students])
+        )}
+        
+        # All demo students share one creation timestamp
+        now = datetime.utcnow()
+        new_rows = []
         for student_data in sample_students:
             # Check if student already exists
-            existing = Student.query.filter_by(roll_number=student_data['roll_number']).first()
-            if existing:
+            if student_data['roll_number'] in existing_rolls:
                 print(f"Student {student_data['name']} already exists. Skipping...")
                 continue
             
             # Create student without photo for now
             # In real usage, photos would be uploaded through the web interface
-            student = Student(
-                name=student_data['name'],
-                roll_number=student_data['roll_number'],
-                photo_path='static/uploads/placeholder.jpg',  # Placeholder path
-                face_encoding=None,  # Will be set when photo is uploaded
-                created_at=datetime.utcnow()
-            )
-            
-            db.session.add(student)
+            new_rows.append({
+                'name': student_data['name'],
+                'roll_number': student_data['roll_number'],
+                'photo_path': 'static/uploads/placeholder.jpg',  # Placeholder path
+                'face_encoding': None,  # Will be set when photo is uploaded
+                'created_at': now
+            })
             print(f"Added student: {student_data['name']} ({student_data['roll_number']})")
         
+        # Insert all new students with a single executemany
+        if new_rows:
+            db.session.execute(Student.__table__.insert(), new_rows)
         db.session.commit()
         print("\nSample students created successfully!")
         print("You can now:")
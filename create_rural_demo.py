@@ -3,7 +3,7 @@ Secure Rural School Attendance System Demo
 This script demonstrates the secure alternatives without RFID
 """
 
-from app_secure_rural import app, db, Student, Attendance, DailyCode, generate_daily_code
+from app_secure_rural import app, db, Student, Attendance, DailyCode, generate_daily_code, generate_secure_token
 import os
 from datetime import datetime, date
 
@@ -69,32 +69,40 @@ def create_rural_demo_data():
         print("🏫 Creating Rural School Demo Data...")
         print("=" * 50)
         
+        # Look up all existing roll numbers in one query
+        existing_rolls = {roll for (roll,) in db.session.query(Student.roll_number).filter(
+            Student.roll_number.in_([s['roll_number'] for s in rural_students])
+        )}
+        
+        # All demo students share one creation timestamp
+        now = datetime.utcnow()
+        new_rows = []
         for student_data in rural_students:
             # Check if student already exists
-            existing = Student.query.filter_by(roll_number=student_data['roll_number']).first()
-            if existing:
+            if student_data['roll_number'] in existing_rolls:
                 print(f"   📚 {student_data['name']} already exists. Skipping...")
                 continue
             
             # Create student with secure token
-            import hashlib, secrets
-            secure_token = hashlib.sha256(f"{student_data['roll_number']}{student_data['name']}{secrets.token_hex(16)}".encode()).hexdigest()[:16]
-            
-            student = Student(
-                name=student_data['name'],
-                roll_number=student_data['roll_number'],
-                parent_name=student_data['parent_name'],
-                phone_number=student_data['phone_number'],
-                secure_token=secure_token,
-                photo_path=None,  # Photos to be added through web interface
-                created_at=datetime.utcnow()
-            )
+            secure_token = generate_secure_token(student_data['roll_number'], student_data['name'])
             
-            db.session.add(student)
+            new_rows.append({
+                'name': student_data['name'],
+                'roll_number': student_data['roll_number'],
+                'parent_name': student_data['parent_name'],
+                'phone_number': student_data['phone_number'],
+                'secure_token': secure_token,
+                'photo_path': None,  # Photos to be added through web interface
+                'created_at': now
+            })
             print(f"   ✅ Added: {student_data['name']} ({student_data['roll_number']})")
         
+        # Insert all new students with a single executemany
+        if new_rows:
+            db.session.execute(Student.__table__.insert(), new_rows)
+        
         # Generate today's daily code
-        daily_code = generate_daily_code()
+        daily_code = generate_daily_code().daily_code
         
         db.session.commit()
         
@@ -126,7 +134,7 @@ def show_daily_info():
     """Show today's attendance information"""
     with app.app_context():
         today = date.today()
-        daily_code = generate_daily_code()
+        daily_code = generate_daily_code().daily_code
         
         students = Student.query.all()
         attendance_records = db.session.query(Attendance, Student).join(Student).filter(
@@ -5,7 +5,11 @@ Enhanced photo storage with BLOB support and metadata
 """
 
 import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 class DatabaseConfig:
     """Database configuration for different SQL backends"""
@@ -13,7 +17,8 @@ class DatabaseConfig:
     # Base configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'rural-school-attendance-secret-key-2025'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_RECORD_QUERIES = True
+    # Recording captures timing and a stack context for every query, so keep it to debug runs
+    SQLALCHEMY_RECORD_QUERIES = os.environ.get('FLASK_DEBUG') == '1'
     
     # File upload configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -54,6 +59,28 @@ class PostgreSQLConfig(DatabaseConfig):
     SQLALCHEMY_DATABASE_URI = f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}/{POSTGRES_DB}'
     DB_TYPE = 'postgresql'
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for the slow storage found on school machines"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    
+    cursor = dbapi_connection.cursor()
+    # 8KB pages hold photo BLOBs in fewer overflow pages; only takes effect
+    # for a new database file, so it must come before switching to WAL
+    cursor.execute('PRAGMA page_size=8192')
+    # WAL: one fsync per commit and readers are not blocked by writers
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    # ~20MB page cache (negative values are KiB)
+    cursor.execute('PRAGMA cache_size=-20000')
+    # Memory-map up to 256MB of the database file for reads
+    cursor.execute('PRAGMA mmap_size=268435456')
+    # SQLite ignores foreign keys (and ON DELETE CASCADE) unless enabled per connection
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
 # Configuration selection
 def get_config():
     """Get database configuration based on environment"""
@@ -93,6 +120,11 @@ def init_database(app, db):
             # Create all tables
             db.create_all()
             
+            # Move photos stored on older student rows into student_photo
+            DatabaseMigration.migrate_student_photo_columns(db)
+            DatabaseMigration.migrate_attendance_archive_key(db)
+            DatabaseMigration.migrate_cascade_foreign_keys(db)
+            
             # Check if we need to add sample data
             from models_enhanced import Student, Attendance, DailyCode, PhotoMetadata
             
@@ -101,6 +133,7 @@ def init_database(app, db):
             
             # Create indexes for better performance
             create_database_indexes(db)
+            create_updated_at_trigger(db)
             
             return True
             
@@ -111,30 +144,112 @@ def init_database(app, db):
 def create_database_indexes(db):
     """Create database indexes for better performance"""
     try:
-        # Index for attendance queries by date
-        db.session.execute("""
-            CREATE INDEX IF NOT EXISTS idx_attendance_date 
-            ON attendance(date);
-        """)
-        
-        # Index for student roll number searches
-        db.session.execute("""
-            CREATE INDEX IF NOT EXISTS idx_student_roll 
-            ON student(roll_number);
-        """)
-        
-        # Index for daily codes by date
-        db.session.execute("""
-            CREATE INDEX IF NOT EXISTS idx_daily_code_date 
-            ON daily_code(date);
-        """)
+        # Run all index DDL in one engine-level transaction, bypassing the ORM session
+        with db.engine.begin() as conn:
+            # Index for attendance queries by date
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_attendance_date 
+                ON attendance(date)
+            """)
+            
+            # Covering index for attendance counts by date and status
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_attendance_date_status 
+                ON attendance(date, status)
+            """)
+            
+            # Composite index for the daily attendance join (filter by date, join on student)
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_attendance_date_student 
+                ON attendance(date, student_id)
+            """)
+            
+            # Index for student roll number searches
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_student_roll 
+                ON student(roll_number)
+            """)
+            
+            # Partial index covering only active students
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_student_active 
+                ON student(is_active) WHERE is_active
+            """)
+            
+            # Index for daily codes by date
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_daily_code_date 
+                ON daily_code(date)
+            """)
+            
+            # Partial index over active daily codes only
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS idx_daily_code_active 
+                ON daily_code(id) WHERE is_active
+            """)
+            
+            # Index for code verification by hash (same name as the model's index=True)
+            conn.exec_driver_sql("""
+                CREATE INDEX IF NOT EXISTS ix_daily_code_code_hash 
+                ON daily_code(code_hash)
+            """)
         
-        db.session.commit()
         print("✅ Database indexes created successfully")
         
     except Exception as e:
         print(f"⚠️ Index creation warning: {e}")
 
+def create_updated_at_trigger(db):
+    """Have the database stamp student.updated_at on every UPDATE"""
+    try:
+        with db.engine.begin() as conn:
+            dialect = conn.dialect.name
+            
+            if dialect == 'sqlite':
+                # Only rows whose UPDATE did not set updated_at itself
+                conn.exec_driver_sql("""
+                    CREATE TRIGGER IF NOT EXISTS trg_student_updated_at
+                    AFTER UPDATE ON student
+                    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+                    BEGIN
+                        UPDATE student SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+                    END
+                """)
+            
+            elif dialect == 'postgresql':
+                conn.exec_driver_sql("""
+                    CREATE OR REPLACE FUNCTION set_student_updated_at() RETURNS trigger AS $$
+                    BEGIN
+                        IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+                            NEW.updated_at := now();
+                        END IF;
+                        RETURN NEW;
+                    END;
+                    $$ LANGUAGE plpgsql
+                """)
+                conn.exec_driver_sql("DROP TRIGGER IF EXISTS trg_student_updated_at ON student")
+                conn.exec_driver_sql("""
+                    CREATE TRIGGER trg_student_updated_at
+                    BEFORE UPDATE ON student
+                    FOR EACH ROW EXECUTE FUNCTION set_student_updated_at()
+                """)
+            
+            elif dialect == 'mysql':
+                # MODIFY rebuilds the table, so only run it if ON UPDATE is missing
+                extra = conn.exec_driver_sql("""
+                    SELECT EXTRA FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'student'
+                    AND COLUMN_NAME = 'updated_at'
+                """).scalar()
+                if extra is not None and 'on update' not in extra.lower():
+                    conn.exec_driver_sql("""
+                        ALTER TABLE student MODIFY updated_at DATETIME
+                        DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    """)
+        
+    except Exception as e:
+        print(f"⚠️ updated_at trigger warning: {e}")
+
 # Database migration utilities
 class DatabaseMigration:
     """Handle database migrations and upgrades"""
@@ -143,14 +258,25 @@ class DatabaseMigration:
     def backup_database(app):
         """Create database backup"""
         if app.config.get('DB_TYPE') == 'sqlite':
-            import shutil
-            from datetime import datetime
             
             db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
             backup_path = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{db_path}"
             
             try:
-                shutil.copy2(db_path, backup_path)
+                # sqlite3.connect would silently create a missing source file
+                if not os.path.exists(db_path):
+                    raise FileNotFoundError(db_path)
+                
+                # SQLite online backup: copies pages in chunks and stays consistent
+                # while the app keeps writing, unlike a raw file copy
+                source = sqlite3.connect(db_path)
+                target = sqlite3.connect(backup_path)
+                try:
+                    with target:
+                        source.backup(target, pages=1024)
+                finally:
+                    target.close()
+                    source.close()
                 print(f"✅ Database backup created: {backup_path}")
                 return backup_path
             except Exception as e:
@@ -158,38 +284,204 @@ class DatabaseMigration:
                 return None
     
     @staticmethod
-    def migrate_photos_to_db(app, db):
+    def migrate_student_photo_columns(db):
+        """Copy photo data from the legacy student.photo_blob column into student_photo"""
+        from sqlalchemy import inspect
+        
+        columns = {column['name'] for column in inspect(db.engine).get_columns('student')}
+        if 'photo_blob' not in columns:
+            return 0
+        
+        # Copy and clear in one transaction; cleared rows are skipped on the next start
+        with db.engine.begin() as conn:
+            copied = conn.exec_driver_sql("""
+                INSERT INTO student_photo (student_id, photo_blob, photo_hash)
+                SELECT id, photo_blob, photo_hash FROM student
+                WHERE photo_blob IS NOT NULL
+                AND id NOT IN (SELECT student_id FROM student_photo)
+            """).rowcount
+            # Students that already had a student_photo row were not copied;
+            # their legacy photo is kept unless it is the same data
+            conn.exec_driver_sql("""
+                UPDATE student SET photo_blob = NULL
+                WHERE photo_blob IS NOT NULL
+                AND id IN (
+                    SELECT student_id FROM student_photo
+                    WHERE student_photo.photo_blob = student.photo_blob
+                )
+            """)
+            conflicts = [row[0] for row in conn.exec_driver_sql(
+                "SELECT id FROM student WHERE photo_blob IS NOT NULL"
+            )]
+        
+        if copied:
+            print(f"✅ Moved {copied} photos to the student_photo table")
+        if conflicts:
+            print(f"⚠️ Legacy photos left in student.photo_blob for students {conflicts}: "
+                  f"they already have a different photo in student_photo")
+        return copied
+    
+    @staticmethod
+    def migrate_attendance_archive_key(db):
+        """Rebuild an attendance_archive keyed on the original attendance id"""
+        from sqlalchemy import inspect
+        from sqlalchemy.schema import DropIndex
+        from models_enhanced import attendance_archive
+        
+        inspector = inspect(db.engine)
+        if 'attendance_archive' not in inspector.get_table_names():
+            return 0
+        if 'archive_id' in {column['name'] for column in inspector.get_columns('attendance_archive')}:
+            return 0
+        
+        columns = [column.name for column in attendance_archive.columns if column.name not in ('archive_id', 'attendance_id')]
+        with db.engine.begin() as conn:
+            # Index names are per database, so free them before creating the new table
+            for index in attendance_archive.indexes:
+                conn.execute(DropIndex(index, if_exists=True))
+            conn.exec_driver_sql('ALTER TABLE attendance_archive RENAME TO attendance_archive_old')
+            attendance_archive.create(conn)
+            moved = conn.exec_driver_sql(f"""
+                INSERT INTO attendance_archive (attendance_id, {', '.join(columns)})
+                SELECT id, {', '.join(columns)} FROM attendance_archive_old
+            """).rowcount
+            conn.exec_driver_sql('DROP TABLE attendance_archive_old')
+        
+        print(f"✅ Rebuilt attendance_archive with its own key ({moved} records)")
+        return moved
+    
+    @staticmethod
+    def migrate_cascade_foreign_keys(db):
+        """Recreate student foreign keys that were created without ON DELETE CASCADE
+        
+        Student relationships use passive_deletes, so deleting a student relies
+        on the database removing its attendance and photo_metadata rows.
+        """
+        from sqlalchemy import inspect
+        from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
+        from models_enhanced import Attendance, PhotoMetadata
+        
+        inspector = inspect(db.engine)
+        stale = [
+            model.__table__ for model in (Attendance, PhotoMetadata)
+            if any(
+                fk['referred_table'] == 'student' and (fk.get('options', {}).get('ondelete') or '').upper() != 'CASCADE'
+                for fk in inspector.get_foreign_keys(model.__tablename__)
+            )
+        ]
+        if not stale:
+            return 0
+        
+        dialect = db.engine.dialect
+        if dialect.name == 'sqlite':
+            # SQLite cannot alter a foreign key: rebuild each table and copy its rows.
+            # Foreign keys stay off meanwhile, since rows written before they were
+            # enforced may point at deleted students
+            raw = db.engine.raw_connection()
+            cursor = raw.cursor()
+            try:
+                cursor.execute('PRAGMA foreign_keys=OFF')
+                cursor.execute('BEGIN')
+                for table in stale:
+                    old_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                    columns = ', '.join(column.name for column in table.columns if column.name in old_columns)
+                    
+                    # Index names are per database; create_database_indexes adds its own back later
+                    for index in inspector.get_indexes(table.name):
+                        cursor.execute(f'DROP INDEX "{index["name"]}"')
+                    cursor.execute(f'ALTER TABLE {table.name} RENAME TO {table.name}_old')
+                    cursor.execute(str(CreateTable(table).compile(dialect=dialect)))
+                    for index in table.indexes:
+                        cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+                    cursor.execute(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old')
+                    cursor.execute(f'DROP TABLE {table.name}_old')
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                raise
+            finally:
+                cursor.execute('PRAGMA foreign_keys=ON')
+                raw.close()
+        else:
+            drop = 'FOREIGN KEY' if dialect.name == 'mysql' else 'CONSTRAINT'
+            with db.engine.begin() as conn:
+                for table in stale:
+                    for fk in inspector.get_foreign_keys(table.name):
+                        if fk['referred_table'] == 'student':
+                            conn.exec_driver_sql(f'ALTER TABLE {table.name} DROP {drop} {fk["name"]}')
+                    for constraint in table.foreign_key_constraints:
+                        conn.execute(AddConstraint(constraint))
+        
+        print(f"✅ Added ON DELETE CASCADE to {', '.join(table.name for table in stale)}")
+        return len(stale)
+    
+    @staticmethod
+    def _read_photo(full_path):
+        """Read a photo file, returning (data, error); data is None if the file is missing"""
+        try:
+            with open(full_path, 'rb') as f:
+                return f.read(), None
+        except FileNotFoundError:
+            return None, None
+        except Exception as e:
+            return None, e
+    
+    @staticmethod
+    def migrate_photos_to_db(app, db, batch_size=100):
         """Migrate existing photo files to database BLOB storage"""
         with app.app_context():
-            from models_enhanced import Student, PhotoMetadata
+            from models_enhanced import Student, StudentPhoto, PhotoMetadata
             
-            students = Student.query.all()
             migrated = 0
+            last_id = 0
             
-            for student in students:
-                if student.photo_path and not student.photo_blob:
-                    try:
-                        # Read photo file
-                        full_path = os.path.join('static', student.photo_path.lstrip('/'))
-                        if os.path.exists(full_path):
-                            with open(full_path, 'rb') as f:
-                                photo_data = f.read()
-                            
-                            # Store in database
-                            student.photo_blob = photo_data
-                            
-                            # Create metadata
-                            metadata = PhotoMetadata(
-                                student_id=student.id,
-                                filename=os.path.basename(full_path),
-                                file_size=len(photo_data),
-                                mime_type='image/jpeg'
-                            )
-                            db.session.add(metadata)
-                            migrated += 1
+            # Walk pending students in id order, one committed batch at a time,
+            # so only one batch of photo data is held in memory
+            while True:
+                students = Student.query.filter(
+                    Student.id > last_id,
+                    Student.photo_path.isnot(None),
+                    ~Student.photo.has(StudentPhoto.photo_blob.isnot(None))
+                ).order_by(Student.id).limit(batch_size).all()
+                
+                if not students:
+                    break
+                last_id = students[-1].id
+                
+                # Read the batch's photo files concurrently; session work stays on this thread
+                full_paths = [os.path.join('static', student.photo_path.lstrip('/')) for student in students]
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    results = list(executor.map(DatabaseMigration._read_photo, full_paths))
+                
+                batch_migrated = 0
+                for student, full_path, (photo_data, error) in zip(students, full_paths, results):
+                    if error is not None:
+                        print(f"⚠️ Failed to migrate photo for {student.name}: {error}")
+                        continue
+                    if photo_data is None:
+                        continue
                     
-                    except Exception as e:
-                        print(f"⚠️ Failed to migrate photo for {student.name}: {e}")
+                    # Store in database
+                    student.photo_blob = photo_data
+                    
+                    # Create metadata
+                    metadata = PhotoMetadata(
+                        student_id=student.id,
+                        filename=os.path.basename(full_path),
+                        file_size=len(photo_data),
+                        mime_type='image/jpeg'
+                    )
+                    db.session.add(metadata)
+                    batch_migrated += 1
+                
+                try:
+                    db.session.commit()
+                    migrated += batch_migrated
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ Failed to save photo batch ending at student {last_id}: {e}")
+                
+                # Release the photo data held by this batch
+                db.session.expunge_all()
             
-            db.session.commit()
-            print(f"✅ Migrated {migrated} photos to database")
\ No newline at end of file
+            print(f"✅ Migrated {migrated} photos to database")
@@ -5,8 +5,24 @@ Check students and their face encodings in the database (handle BLOB format)
 
 import sqlite3
 import json
-import numpy as np
-import pickle
+
+# Pickle protocol 2+ streams start with the PROTO opcode followed by the version
+PICKLE_PREFIXES = (b'\x80\x02', b'\x80\x03', b'\x80\x04', b'\x80\x05')
+
+def decode_encoding(face_encoding):
+    """Detect the storage format from its first bytes and decode it once"""
+    # Imported lazily: numpy is only needed when there are encodings to decode
+    import numpy as np
+    import pickle
+    
+    if isinstance(face_encoding, str):
+        return 'JSON', np.asarray(json.loads(face_encoding))
+    if face_encoding[:1] == b'[':
+        return 'JSON from bytes', np.asarray(json.loads(face_encoding))
+    if face_encoding[:2] in PICKLE_PREFIXES:
+        return 'Pickle', pickle.loads(face_encoding)
+    # Raw array bytes, as written by app_enhanced_sql (float32)
+    return 'NumPy', np.frombuffer(face_encoding, dtype=np.float32)
 
 def check_students():
     """Check all students and their face encodings"""
@@ -30,46 +46,15 @@ def check_students():
             print(f"   Photo: {photo_filename}")
             
             if face_encoding:
+                print(f"   📊 Face encoding type: {type(face_encoding)}")
+                print(f"   📊 Face encoding length: {len(face_encoding)} bytes")
                 try:
-                    # Try different formats for face encoding
-                    print(f"   📊 Face encoding type: {type(face_encoding)}")
-                    print(f"   📊 Face encoding length: {len(face_encoding)} bytes")
-                    
-                    # Try to decode as JSON string first
-                    if isinstance(face_encoding, str):
-                        encoding_data = json.loads(face_encoding)
-                        encoding_array = np.array(encoding_data)
-                        print(f"   ✅ Face Encoding (JSON): {len(encoding_array)} features")
-                        print(f"   🔢 Encoding sample: {encoding_array[:5]}...")
-                    
-                    # Try to decode as binary/BLOB
-                    elif isinstance(face_encoding, bytes):
-                        try:
-                            # Try pickle first
-                            encoding_array = pickle.loads(face_encoding)
-                            print(f"   ✅ Face Encoding (Pickle): {len(encoding_array)} features")
-                            print(f"   🔢 Encoding sample: {encoding_array[:5]}...")
-                        except:
-                            try:
-                                # Try numpy array bytes
-                                encoding_array = np.frombuffer(face_encoding, dtype=np.float64)
-                                print(f"   ✅ Face Encoding (NumPy): {len(encoding_array)} features")
-                                print(f"   🔢 Encoding sample: {encoding_array[:5]}...")
-                            except:
-                                try:
-                                    # Try JSON from bytes
-                                    encoding_str = face_encoding.decode('utf-8')
-                                    encoding_data = json.loads(encoding_str)
-                                    encoding_array = np.array(encoding_data)
-                                    print(f"   ✅ Face Encoding (JSON from bytes): {len(encoding_array)} features")
-                                    print(f"   🔢 Encoding sample: {encoding_array[:5]}...")
-                                except:
-                                    print(f"   ❌ Could not decode face encoding")
-                                    print(f"   🔍 First 20 bytes: {face_encoding[:20]}")
-                    
+                    encoding_format, encoding_array = decode_encoding(face_encoding)
+                    print(f"   ✅ Face Encoding ({encoding_format}): {len(encoding_array)} features")
+                    print(f"   🔢 Encoding sample: {encoding_array[:5]}...")
                 except Exception as e:
-                    print(f"   ❌ Face encoding error: {e}")
-                    print(f"   🔍 First 20 bytes: {face_encoding[:20] if face_encoding else 'None'}")
+                    print(f"   ❌ Could not decode face encoding: {e}")
+                    print(f"   🔍 First 20 bytes: {face_encoding[:20]}")
             else:
                 print(f"   ❌ No face encoding")
             
@@ -3,15 +3,43 @@
 Debug face recognition step by step
 """
 
+import sys
 import sqlite3
 import numpy as np
 import cv2
 import requests
-import base64
-from io import BytesIO
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def debug_face_recognition():
+API_URL = 'http://127.0.0.1:5000'
+
+# (connect, read) timeouts in seconds
+API_TIMEOUT = (3, 30)
+
+# Frames to discard in headless mode while the camera adjusts exposure
+HEADLESS_WARMUP_FRAMES = 10
+
+def create_api_session():
+    """Create an HTTP session that keeps connections to the Flask API alive"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    )
+    session.mount('http://', adapter)
+    return session
+
+def open_camera(index=0):
+    """Open the webcam with compressed 640x480 frames and a one-frame buffer"""
+    cap = cv2.VideoCapture(index)
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+def debug_face_recognition(headless=False):
     """Debug the entire face recognition pipeline"""
     print("🔍 Debugging Face Recognition Pipeline...")
     
@@ -24,9 +52,19 @@ def debug_face_recognition():
     conn.close()
     
     print(f"Found {len(student_rows)} students with face encodings:")
-    for row in student_rows:
+    
+    # Decode all encodings with one allocation when they share a length
+    blobs = [row[3] for row in student_rows]
+    encodings = None
+    if blobs and len({len(blob) for blob in blobs}) == 1 and len(blobs[0]) % 4 == 0:
+        encodings = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+    
+    for i, row in enumerate(student_rows):
         try:
-            encoding = np.frombuffer(row[3], dtype=np.float64)
+            if encodings is not None:
+                encoding = encodings[i]
+            else:
+                encoding = np.frombuffer(row[3], dtype=np.float32)
             print(f"   ✅ {row[1]} ({row[2]}) - {len(encoding)} features")
             print(f"      Sample values: {encoding[:3]}")
         except Exception as e:
@@ -34,21 +72,32 @@ def debug_face_recognition():
     
     # Step 2: Capture test image
     print("\n📸 Step 2: Capturing test image...")
-    print("Opening webcam... Press SPACE to capture, ESC to quit")
+    if headless:
+        print("Opening webcam... capturing automatically (headless)")
+    else:
+        print("Opening webcam... Press SPACE to capture, ESC to quit")
     
-    cap = cv2.VideoCapture(0)
+    cap = open_camera()
     if not cap.isOpened():
         print("❌ Could not open webcam")
         return
     
     test_image = None
+    frames_read = 0
     while True:
         ret, frame = cap.read()
         if not ret:
             break
+        frames_read += 1
+        
+        if headless:
+            if frames_read >= HEADLESS_WARMUP_FRAMES:
+                test_image = frame
+                break
+            continue
         
         cv2.imshow('Capture Test Image - Press SPACE', frame)
-        key = cv2.waitKey(1) & 0xFF
+        key = cv2.waitKey(10) & 0xFF
         
         if key == ord(' '):
             test_image = frame.copy()
@@ -57,7 +106,8 @@ def debug_face_recognition():
             break
     
     cap.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
     
     if test_image is None:
         print("❌ No image captured")
@@ -75,7 +125,8 @@ def debug_face_recognition():
     # Send to Flask endpoint
     try:
         files = {'photo': ('test.jpg', image_bytes, 'image/jpeg')}
-        response = requests.post('http://127.0.0.1:5000/detect_and_identify_faces', files=files, timeout=30)
+        with create_api_session() as session:
+            response = session.post(f'{API_URL}/detect_and_identify_faces', files=files, timeout=API_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
@@ -112,4 +163,4 @@ def debug_face_recognition():
         print(f"❌ Error: {e}")
 
 if __name__ == '__main__':
-    debug_face_recognition()
\ No newline at end of file
+    debug_face_recognition(headless='--headless' in sys.argv[1:])
\ No newline at end of file
@@ -11,6 +11,8 @@ def fix_encodings():
     print("🔄 Converting existing face encodings...")
     
     conn = sqlite3.connect('attendance_enhanced.db')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
     cursor = conn.cursor()
     
     # Get all students with face encodings
@@ -19,6 +21,7 @@ def fix_encodings():
     
     print(f"📊 Found {len(students)} students with encodings")
     
+    updates = []
     for student_id, name, face_encoding in students:
         try:
             # Try to read as float64 (old format)
@@ -26,18 +29,17 @@ def fix_encodings():
             print(f"👤 {name}: Converting {len(old_encoding)} features from float64 to float32")
             
             # Convert to float32
-            new_encoding = old_encoding.astype(np.float32)
-            new_bytes = new_encoding.tobytes()
+            new_bytes = old_encoding.astype(np.float32).tobytes()
+            updates.append((new_bytes, student_id))
             
-            # Update in database
-            cursor.execute('UPDATE student SET face_encoding = ? WHERE id = ?', (new_bytes, student_id))
-            
-            print(f"   ✅ Converted: {len(new_encoding)} features, {len(new_bytes)} bytes")
+            print(f"   ✅ Converted: {len(old_encoding)} features, {len(new_bytes)} bytes")
             
         except Exception as e:
             print(f"   ❌ Error converting {name}: {e}")
     
-    conn.commit()
+    # Write every conversion with one prepared statement in one transaction
+    with conn:
+        cursor.executemany('UPDATE student SET face_encoding = ? WHERE id = ?', updates)
     
     # Verify
     print("\n🔍 Verifying conversions...")
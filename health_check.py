@@ -7,6 +7,7 @@ import sys
 import os
 import subprocess
 import platform
+from importlib.metadata import distribution, PackageNotFoundError
 
 def check_python_version():
     """Check if Python version is compatible"""
@@ -34,11 +35,13 @@ def check_required_packages():
     
     missing_packages = []
     
+    # Look up installed distributions instead of importing them, so heavy
+    # packages like OpenCV are not loaded just to be checked
     for package in required_packages:
         try:
-            __import__(package.replace('-', '_'))
+            distribution(package)
             print(f"   ✅ {package}")
-        except ImportError:
+        except PackageNotFoundError:
             print(f"   ❌ {package} - Missing")
             missing_packages.append(package)
     
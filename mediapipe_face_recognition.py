@@ -4,15 +4,199 @@ Automatic face detection, encoding, and student identification
 """
 
 import cv2
+import sqlite3
 import numpy as np
 import mediapipe as mp
-from PIL import Image
-import io
 import base64
-import hashlib
 from typing import List, Dict, Optional, Tuple
 import logging
 
+# Optional: Numba-compiled similarity kernels
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    # Explicit signatures compile at import and, with cache=True, are loaded
+    # from the on-disk cache on later starts instead of on the first request
+    @njit('f4(f4[::1], f4[::1])', cache=True, fastmath=True)
+    def _cosine_similarity(a, b):
+        """Cosine similarity of two vectors in one fused pass (-1.0 if either is zero)"""
+        dot = 0.0
+        norm_a = 0.0
+        norm_b = 0.0
+        for i in range(a.shape[0]):
+            dot += a[i] * b[i]
+            norm_a += a[i] * a[i]
+            norm_b += b[i] * b[i]
+        if norm_a == 0.0 or norm_b == 0.0:
+            return -1.0
+        return dot / (np.sqrt(norm_a) * np.sqrt(norm_b))
+    
+    @njit('f4[::1](f4[:, ::1], f4[::1])', cache=True, fastmath=True, parallel=True)
+    def _batch_dot(matrix, probe):
+        """Dot product of every matrix row against probe, rows in parallel"""
+        out = np.empty(matrix.shape[0], dtype=np.float32)
+        for i in prange(matrix.shape[0]):
+            acc = 0.0
+            for j in range(matrix.shape[1]):
+                acc += matrix[i, j] * probe[j]
+            out[i] = acc
+        return out
+    
+    @njit('i4[::1](i1[:, ::1], i1[::1])', cache=True, parallel=True)
+    def _batch_int8_dot(matrix, probe):
+        """Dot product of every int8 matrix row against an int8 probe, int32 accumulation"""
+        out = np.empty(matrix.shape[0], dtype=np.int32)
+        for i in prange(matrix.shape[0]):
+            acc = np.int32(0)
+            for j in range(matrix.shape[1]):
+                acc += np.int32(matrix[i, j]) * np.int32(probe[j])
+            out[i] = acc
+        return out
+else:
+    def _cosine_similarity(a, b):
+        """Cosine similarity of two vectors (-1.0 if either is zero)"""
+        norm_a = np.linalg.norm(a)
+        norm_b = np.linalg.norm(b)
+        if norm_a == 0 or norm_b == 0:
+            return -1.0
+        return np.dot(a, b) / (norm_a * norm_b)
+    
+    def _batch_dot(matrix, probe):
+        """Dot product of every matrix row against probe"""
+        return matrix @ probe
+    
+    def _batch_int8_dot(matrix, probe):
+        """Dot product of every int8 matrix row against an int8 probe"""
+        return matrix.astype(np.int32) @ probe.astype(np.int32)
+
+# From this many known faces FaceDB matches against the int8 matrix by
+# default: a quarter of the memory traffic per probe, for a cosine error of
+# well under 0.01 that is negligible next to the match threshold
+QUANTIZED_MIN_FACES = 2000
+
+def quantize(encoding: np.ndarray) -> np.ndarray:
+    """Quantize a unit-normalized encoding to int8 (scale 127)"""
+    return np.clip(np.round(encoding * 127), -128, 127).astype(np.int8)
+
+def warmup(encoding_size: int = 128) -> None:
+    """Run each similarity kernel once so the first request does not pay for it"""
+    vector = np.ones(encoding_size, dtype=np.float32)
+    matrix = np.ones((2, encoding_size), dtype=np.float32)
+    _cosine_similarity(vector, vector)
+    _batch_dot(matrix, vector)
+    _batch_int8_dot(quantize(matrix), quantize(vector))
+
+class FaceDB:
+    """Known face encodings as one contiguous, row-normalized float32 matrix plus metadata"""
+    
+    def __init__(self, known_faces: Optional[List[Dict]] = None, encoding_size: int = 128,
+                 quantized: Optional[bool] = None):
+        """
+        Args:
+            known_faces: List of known faces with 'encoding' and any metadata
+            encoding_size: Expected encoding length; other sizes are skipped
+            quantized: Match against an int8 copy of the matrix (4x smaller);
+                None to do so from QUANTIZED_MIN_FACES known faces
+        """
+        self.encoding_size = encoding_size
+        self.meta = []
+        rows = []
+        for known_face in known_faces or []:
+            if 'encoding' not in known_face:
+                continue
+            encoding = np.asarray(known_face['encoding'], dtype=np.float32)
+            if encoding.shape != (encoding_size,):
+                logging.getLogger(__name__).warning(
+                    f"Skipping known face with encoding shape {encoding.shape}"
+                )
+                continue
+            self.meta.append(known_face)
+            rows.append(encoding)
+        
+        if rows:
+            self.mat = np.ascontiguousarray(np.stack(rows))
+        else:
+            self.mat = np.zeros((0, encoding_size), dtype=np.float32)
+        
+        if quantized is None:
+            quantized = len(rows) >= QUANTIZED_MIN_FACES
+        self.quantized = quantized
+        
+        # Normalize rows once; zero rows can never match (as in compare_faces)
+        self.norms = np.linalg.norm(self.mat, axis=1)
+        self.valid = self.norms > 0
+        self.mat[self.valid] /= self.norms[self.valid, np.newaxis]
+        self.mat_i8 = quantize(self.mat) if quantized else None
+        if quantized:
+            # Rounding inflates norms slightly; rescale by the quantized norms
+            # rather than a flat 127**2 so similarities are not biased upwards
+            self.norms_i8 = np.linalg.norm(self.mat_i8.astype(np.float32), axis=1)
+            self.norms_i8[~self.valid] = 1.0
+    
+    @classmethod
+    def from_sqlite(cls, db_path: str = 'attendance_enhanced.db', encoding_size: int = 128,
+                    quantized: Optional[bool] = None) -> 'FaceDB':
+        """Load active students' float32 encodings straight from the database"""
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                'SELECT id, name, roll_number, face_encoding FROM student '
+                'WHERE is_active = 1 AND face_encoding IS NOT NULL'
+            ).fetchall()
+        finally:
+            conn.close()
+        
+        known_faces = [{
+            'id': row[0],
+            'name': row[1],
+            'roll_number': row[2],
+            'encoding': np.frombuffer(row[3], dtype=np.float32)
+        } for row in rows]
+        return cls(known_faces, encoding_size=encoding_size, quantized=quantized)
+    
+    def __len__(self) -> int:
+        return len(self.meta)
+    
+    def match(self, probe: np.ndarray) -> Tuple[int, float]:
+        """
+        Find the most similar known face
+        
+        Args:
+            probe: Face encoding to match
+            
+        Returns:
+            (index into meta, similarity 0-1), or (-1, 0.0) if nothing can match
+        """
+        if len(self.meta) == 0:
+            return -1, 0.0
+        
+        probe = np.ascontiguousarray(probe, dtype=np.float32)
+        if probe.shape != (self.encoding_size,):
+            return -1, 0.0
+        
+        probe_norm = np.linalg.norm(probe)
+        if probe_norm == 0:
+            return -1, 0.0
+        probe = probe / probe_norm
+        
+        if self.quantized:
+            probe_i8 = quantize(probe)
+            scale = self.norms_i8 * np.linalg.norm(probe_i8.astype(np.float32))
+            cosines = _batch_int8_dot(self.mat_i8, probe_i8) / scale
+            similarities = ((cosines + 1) / 2).astype(np.float32)
+        else:
+            # Rows are unit-normalized, so one dot per row against the
+            # normalized probe is the cosine similarity
+            similarities = (_batch_dot(self.mat, probe) + 1) / 2
+        similarities[~self.valid] = 0.0
+        
+        best_index = int(np.argmax(similarities))
+        return best_index, float(similarities[best_index])
+
 class MediaPipeFaceRecognition:
     """Enhanced MediaPipe-based face recognition system"""
     
@@ -40,6 +224,16 @@ class MediaPipeFaceRecognition:
         self.encoding_size = 128
         self.similarity_threshold = 0.3  # Lowered from 0.6 to make matching easier
         
+        # Frames larger than this (longest side, pixels) are downscaled for detection
+        self.max_detection_size = 1280
+        
+        # Image I/O parameters
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        self.reduced_decode_min_bytes = 1024 * 1024  # Decode at half size above this (phone photos)
+        
+        # Known faces used when identify_faces is called without a database
+        self.face_db = FaceDB(encoding_size=self.encoding_size)
+        
         # Logging setup
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -58,43 +252,52 @@ class MediaPipeFaceRecognition:
             print("❌ Face detection: Image is None")
             return []
             
+        return self._detect_faces_rgb(self._to_rgb(image))
+    
+    def _to_rgb(self, image: np.ndarray) -> np.ndarray:
+        """Convert a BGR/BGRA image to RGB (other layouts are returned unchanged)"""
+        if len(image.shape) == 3 and image.shape[2] == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        elif len(image.shape) == 3 and image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+        return image
+    
+    def _detect_faces_rgb(self, rgb_image: np.ndarray) -> List[Dict]:
+        """Detect faces in an image that is already RGB"""
         try:
-            print(f"🔎 Face detection: Processing image {image.shape}")
-            # Convert BGR to RGB if needed
-            if len(image.shape) == 3 and image.shape[2] == 3:
-                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            else:
-                rgb_image = image
-                
-            # Detect faces
-            results = self.face_detection.process(rgb_image)
+            print(f"🔎 Face detection: Processing image {rgb_image.shape}")
+            
+            # Detect faces on a downscaled copy of large frames; boxes are
+            # relative, so they map straight back onto the full-size image
+            h, w = rgb_image.shape[:2]
+            detection_image = rgb_image
+            if max(h, w) > self.max_detection_size:
+                scale = self.max_detection_size / max(h, w)
+                detection_image = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            results = self.face_detection.process(detection_image)
             
             faces = []
             if results.detections:
                 print(f"✅ MediaPipe detected {len(results.detections)} faces")
-                h, w = image.shape[:2]
                 
-                for detection in results.detections:
-                    # Get bounding box
-                    bbox = detection.location_data.relative_bounding_box
-                    
-                    # Convert to pixel coordinates
-                    x = int(bbox.xmin * w)
-                    y = int(bbox.ymin * h)
-                    width = int(bbox.width * w)
-                    height = int(bbox.height * h)
-                    
-                    # Ensure coordinates are within image bounds
-                    x = max(0, x)
-                    y = max(0, y)
-                    width = min(width, w - x)
-                    height = min(height, h - y)
-                    
+                # Convert all bounding boxes to pixel coordinates at once
+                boxes = np.array([
+                    (bbox.xmin, bbox.ymin, bbox.width, bbox.height)
+                    for bbox in (d.location_data.relative_bounding_box for d in results.detections)
+                ], dtype=np.float64)
+                boxes = (boxes * np.array([w, h, w, h])).astype(np.int32)
+                
+                # Ensure coordinates are within image bounds
+                np.maximum(boxes[:, :2], 0, out=boxes[:, :2])
+                np.minimum(boxes[:, 2:], np.array([w, h], dtype=np.int32) - boxes[:, :2], out=boxes[:, 2:])
+                
+                for detection, (x, y, width, height) in zip(results.detections, boxes.tolist()):
                     face_info = {
                         'bbox': (x, y, width, height),
                         'confidence': detection.score[0],
                         'landmarks': self._extract_key_landmarks(detection),
-                        'face_region': image[y:y+height, x:x+width]
+                        # RGB view of the face, so encoding needs no second conversion
+                        'face_region': rgb_image[y:y+height, x:x+width]
                     }
                     
                     faces.append(face_info)
@@ -127,7 +330,7 @@ class MediaPipeFaceRecognition:
         Generate a face encoding/embedding from face image
         
         Args:
-            face_image: Cropped face image
+            face_image: Cropped RGB face image (face_region from detect_faces)
             
         Returns:
             Face encoding as numpy array or None if failed
@@ -136,28 +339,17 @@ class MediaPipeFaceRecognition:
             if face_image is None or face_image.size == 0:
                 return None
                 
-            # Resize face to standard size
-            face_resized = cv2.resize(face_image, (160, 160))
+            # Resize face to standard size (already RGB, see detect_faces)
+            face_rgb = cv2.resize(face_image, (160, 160))
             
-            # Convert to RGB
-            if len(face_resized.shape) == 3:
-                face_rgb = cv2.cvtColor(face_resized, cv2.COLOR_BGR2RGB)
-            else:
-                face_rgb = face_resized
-                
             # Get face mesh landmarks
             results = self.face_mesh.process(face_rgb)
             
             if results.multi_face_landmarks:
                 landmarks = results.multi_face_landmarks[0]
                 
-                # Extract landmark coordinates
-                landmark_points = []
-                for landmark in landmarks.landmark:
-                    landmark_points.extend([landmark.x, landmark.y, landmark.z])
-                
-                # Convert to numpy array and normalize
-                encoding = np.array(landmark_points[:self.encoding_size], dtype=np.float32)
+                # Extract landmark coordinates and normalize
+                encoding = self._landmark_points(landmarks).ravel()[:self.encoding_size]
                 encoding = encoding / np.linalg.norm(encoding)  # Normalize
                 
                 return encoding
@@ -169,25 +361,73 @@ class MediaPipeFaceRecognition:
             self.logger.error(f"Face encoding error: {e}")
             return None
     
+    def _landmark_points(self, landmarks) -> np.ndarray:
+        """(x, y, z) of the landmarks that make up an encoding, as an (n, 3) float32 array"""
+        # Only the first ceil(encoding_size / 3) landmarks contribute
+        count = min(-(-self.encoding_size // 3), len(landmarks.landmark))
+        points = np.empty((count, 3), dtype=np.float32)
+        for i, landmark in enumerate(landmarks.landmark[:count]):
+            points[i] = (landmark.x, landmark.y, landmark.z)
+        return points
+    
+    def process_frame(self, rgb_image: np.ndarray) -> List:
+        """
+        Run FaceMesh once on a full RGB frame
+        
+        Args:
+            rgb_image: Full RGB frame
+            
+        Returns:
+            All detected landmark sets (empty list if none)
+        """
+        try:
+            results = self.face_mesh.process(rgb_image)
+            return list(results.multi_face_landmarks or [])
+        except Exception as e:
+            self.logger.error(f"Face mesh error: {e}")
+            return []
+    
+    def _mesh_encoding(self, landmarks, bbox: Tuple[int, int, int, int],
+                       frame_shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+        """
+        Build a face encoding from full-frame mesh landmarks
+        
+        Coordinates are re-expressed relative to the face bbox, matching the
+        encodings generate_face_encoding produces from a cropped face.
+        """
+        x, y, width, height = bbox
+        if width <= 0 or height <= 0:
+            return None
+        h, w = frame_shape[:2]
+        
+        points = self._landmark_points(landmarks)
+        points[:, 0] = (points[:, 0] * w - x) / width
+        points[:, 1] = (points[:, 1] * h - y) / height
+        points[:, 2] *= w / width
+        
+        encoding = points.ravel()[:self.encoding_size]
+        norm = np.linalg.norm(encoding)
+        if norm == 0:
+            return None
+        return encoding / norm
+    
     def _generate_basic_encoding(self, face_image: np.ndarray) -> np.ndarray:
         """Generate basic face encoding from image features"""
         try:
-            # Convert to grayscale
+            # Grayscale, resize to 32x32 and flatten (a view, no copy)
             gray = cv2.cvtColor(face_image, cv2.COLOR_RGB2GRAY) if len(face_image.shape) == 3 else face_image
+            pixels = cv2.resize(gray, (32, 32)).ravel()
             
-            # Resize to standard size
-            gray = cv2.resize(gray, (32, 32))
+            # Scale only the pixels that are kept into a zero-padded encoding
+            encoding = np.zeros(self.encoding_size, dtype=np.float32)
+            count = min(pixels.size, self.encoding_size)
+            np.multiply(pixels[:count], np.float32(1 / 255.0), out=encoding[:count])  # Normalize to 0-1
             
-            # Flatten and normalize
-            encoding = gray.flatten().astype(np.float32)
-            encoding = encoding / 255.0  # Normalize to 0-1
+            # Unit length like the landmark encodings (cosine similarity is unchanged)
+            norm = np.linalg.norm(encoding)
+            if norm > 0:
+                encoding /= norm
             
-            # Pad or truncate to desired size
-            if len(encoding) > self.encoding_size:
-                encoding = encoding[:self.encoding_size]
-            elif len(encoding) < self.encoding_size:
-                encoding = np.pad(encoding, (0, self.encoding_size - len(encoding)))
-                
             return encoding
             
         except Exception as e:
@@ -198,6 +438,11 @@ class MediaPipeFaceRecognition:
         """
         Compare two face encodings and return similarity score
         
+        Encodings from this class are unit-normalized, so for equal lengths
+        the cosine similarity is a plain dot product. Anything else (e.g.
+        unnormalized encodings stored by older versions) takes the full
+        cosine path.
+        
         Args:
             encoding1: First face encoding
             encoding2: Second face encoding
@@ -208,21 +453,25 @@ class MediaPipeFaceRecognition:
         try:
             if encoding1 is None or encoding2 is None:
                 return 0.0
-                
-            # Ensure same length
-            min_len = min(len(encoding1), len(encoding2))
-            enc1 = encoding1[:min_len]
-            enc2 = encoding2[:min_len]
-            
-            # Calculate cosine similarity
-            dot_product = np.dot(enc1, enc2)
-            norm1 = np.linalg.norm(enc1)
-            norm2 = np.linalg.norm(enc2)
             
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
+            if len(encoding1) == len(encoding2):
+                enc1 = np.ascontiguousarray(encoding1, dtype=np.float32)
+                enc2 = np.ascontiguousarray(encoding2, dtype=np.float32)
                 
-            similarity = dot_product / (norm1 * norm2)
+                # Squared norms need no sqrt; |norm - 1| <= 1e-3 is within 2e-3 of 1 squared
+                if abs(np.dot(enc1, enc1) - 1.0) <= 2e-3 and abs(np.dot(enc2, enc2) - 1.0) <= 2e-3:
+                    similarity = float(np.dot(enc1, enc2))
+                else:
+                    # Zero encodings (failed generation) give -1.0, mapped to 0.0 below
+                    similarity = _cosine_similarity(enc1, enc2)
+            else:
+                # Truncating breaks unit length, so fall back to full cosine
+                min_len = min(len(encoding1), len(encoding2))
+                enc1 = np.ascontiguousarray(encoding1[:min_len], dtype=np.float32)
+                enc2 = np.ascontiguousarray(encoding2[:min_len], dtype=np.float32)
+                
+                # Calculate cosine similarity (-1.0 for zero vectors maps to 0.0 below)
+                similarity = _cosine_similarity(enc1, enc2)
             
             # Convert to 0-1 range
             similarity = (similarity + 1) / 2
@@ -233,13 +482,25 @@ class MediaPipeFaceRecognition:
             self.logger.error(f"Face comparison error: {e}")
             return 0.0
     
-    def identify_faces(self, image: np.ndarray, known_faces: List[Dict]) -> List[Dict]:
+    def set_known_faces(self, known_faces) -> None:
+        """
+        Set the known faces used by identify_faces
+        
+        Args:
+            known_faces: FaceDB, or list of known faces with encodings and metadata
+        """
+        if not isinstance(known_faces, FaceDB):
+            known_faces = FaceDB(known_faces, encoding_size=self.encoding_size)
+        self.face_db = known_faces
+    
+    def identify_faces(self, image: np.ndarray, known_faces=None) -> List[Dict]:
         """
         Identify faces in image against known faces database
         
         Args:
             image: Input image
-            known_faces: List of known faces with encodings and metadata
+            known_faces: FaceDB (or list of known faces with encodings and metadata);
+                if omitted, the faces from the last set_known_faces call are used
             
         Returns:
             List of identified faces with match information
@@ -247,25 +508,44 @@ class MediaPipeFaceRecognition:
         identified_faces = []
         
         try:
-            # Detect faces in image
-            detected_faces = self.detect_faces(image)
+            if known_faces is not None:
+                self.set_known_faces(known_faces)
+            
+            if image is None:
+                return identified_faces
+            
+            # Detect faces, then run FaceMesh once for the whole frame
+            rgb_image = self._to_rgb(image)
+            detected_faces = self._detect_faces_rgb(rgb_image)
+            mesh_faces = self.process_frame(rgb_image) if detected_faces else []
+            h, w = rgb_image.shape[:2]
+            centroids = [
+                (np.mean([lm.x for lm in landmarks.landmark]) * w,
+                 np.mean([lm.y for lm in landmarks.landmark]) * h)
+                for landmarks in mesh_faces
+            ]
             
             for face in detected_faces:
-                # Generate encoding for detected face
-                face_encoding = self.generate_face_encoding(face['face_region'])
+                # Use the landmark set whose centroid lies inside this face's bbox
+                x, y, width, height = face['bbox']
+                face_encoding = None
+                for landmarks, (cx, cy) in zip(mesh_faces, centroids):
+                    if x <= cx < x + width and y <= cy < y + height:
+                        face_encoding = self._mesh_encoding(landmarks, face['bbox'], rgb_image.shape)
+                        break
+                
+                # Faces the full-frame mesh missed fall back to the cropped path
+                if face_encoding is None:
+                    face_encoding = self.generate_face_encoding(face['face_region'])
                 
                 if face_encoding is not None:
+                    # Compare with all known faces at once
                     best_match = None
                     best_similarity = 0.0
-                    
-                    # Compare with known faces
-                    for known_face in known_faces:
-                        if 'encoding' in known_face:
-                            similarity = self.compare_faces(face_encoding, known_face['encoding'])
-                            
-                            if similarity > best_similarity and similarity > self.similarity_threshold:
-                                best_similarity = similarity
-                                best_match = known_face
+                    best_index, similarity = self.face_db.match(face_encoding)
+                    if best_index >= 0 and similarity > self.similarity_threshold:
+                        best_match = self.face_db.meta[best_index]
+                        best_similarity = similarity
                     
                     # Add identification result
                     face_result = {
@@ -284,26 +564,36 @@ class MediaPipeFaceRecognition:
             
         return identified_faces
     
-    def process_image_for_attendance(self, image_data: bytes) -> Dict:
+    def process_image_for_attendance(self, image_data: bytes, need_color: bool = False) -> Dict:
         """
         Process image for attendance marking - main entry point
         
         Args:
             image_data: Raw image data
+            need_color: Decode in color; detection alone only needs grayscale
             
         Returns:
             Processing results with identified students
         """
         try:
-            # Convert bytes to numpy array
+            # Convert bytes to numpy array; large photos are downscaled by
+            # libjpeg during decoding, which is much faster than a full decode
             nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            scale = 2 if len(image_data) >= self.reduced_decode_min_bytes else 1
+            if need_color:
+                flags = cv2.IMREAD_REDUCED_COLOR_2 if scale == 2 else cv2.IMREAD_COLOR
+            else:
+                flags = cv2.IMREAD_REDUCED_GRAYSCALE_2 if scale == 2 else cv2.IMREAD_GRAYSCALE
+            image = cv2.imdecode(nparr, flags)
             
             if image is None:
                 return {'success': False, 'error': 'Invalid image data'}
             
-            # Detect faces
-            faces = self.detect_faces(image)
+            # Detect faces (MediaPipe needs three channels, so expand grayscale)
+            if need_color:
+                faces = self.detect_faces(image)
+            else:
+                faces = self._detect_faces_rgb(cv2.cvtColor(image, cv2.COLOR_GRAY2RGB))
             
             result = {
                 'success': True,
@@ -313,7 +603,8 @@ class MediaPipeFaceRecognition:
             
             for face in faces:
                 face_info = {
-                    'bbox': face['bbox'],
+                    # Report boxes in the original image's coordinates
+                    'bbox': tuple(v * scale for v in face['bbox']),
                     'confidence': float(face['confidence']),
                     'encoding': face.get('encoding', None)
                 }
@@ -328,7 +619,7 @@ class MediaPipeFaceRecognition:
     def encode_image_to_base64(self, image: np.ndarray) -> str:
         """Convert image to base64 string"""
         try:
-            _, buffer = cv2.imencode('.jpg', image)
+            _, buffer = cv2.imencode('.jpg', image, self.jpeg_params)
             image_base64 = base64.b64encode(buffer).decode('utf-8')
             return image_base64
         except Exception as e:
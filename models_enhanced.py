@@ -4,13 +4,29 @@ Supports photo storage in database (BLOB) and enhanced metadata
 """
 
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
+from sqlalchemy import FetchedValue, and_, bindparam, case, delete, event, exists, false, func, select, text, true, union_all, update
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import Session, column_property, deferred
+from datetime import datetime, date, timezone
 import hashlib
+import os
 import secrets
 import base64
+import sqlite3
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 db = SQLAlchemy()
 
+# Length of the float32 face encodings stored in Student.face_encoding
+FACE_ENCODING_SIZE = 128
+
+# Photo hashes are computed here so the request thread can keep working
+# (hashlib releases the GIL for large buffers); one thread per core lets a
+# bulk upload hash its photos in parallel
+_hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='photo-hash')
+
 class Student(db.Model):
     """Enhanced Student model with photo BLOB storage"""
     __tablename__ = 'student'
@@ -27,57 +43,108 @@ class Student(db.Model):
     parent_phone = db.Column(db.String(15), nullable=True)  # New: Parent contact
     address = db.Column(db.Text, nullable=True)             # New: Address
     
-    # Photo Storage (Enhanced)
+    # Photo Storage (Enhanced) - photo data lives in StudentPhoto, off the hot row
     photo_path = db.Column(db.String(200), nullable=True)   # File path (backup)
-    photo_blob = db.Column(db.LargeBinary, nullable=True)   # Photo data in database
-    photo_hash = db.Column(db.String(64), nullable=True)    # SHA-256 hash for integrity
     
     # Face Recognition Data
-    face_encoding = db.Column(db.LargeBinary, nullable=True) # Face encoding as binary data
+    # Face encoding: FACE_ENCODING_SIZE float32 values as raw bytes (see face_vector; loaded on access)
+    face_encoding = deferred(db.Column(db.LargeBinary, nullable=True), group='face')
+    has_face_encoding = column_property(face_encoding.expression.isnot(None))  # Computed in SQL, no BLOB read
     face_confidence = db.Column(db.Float, nullable=True)    # Recognition confidence
     
     # Security and Authentication
     secure_token = db.Column(db.String(100), nullable=True)
-    qr_code_data = db.Column(db.Text, nullable=True)        # QR code for mobile attendance
+    qr_code_data = deferred(db.Column(db.Text, nullable=True), group='qr')  # QR code for mobile attendance (loaded on access)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Python defaults too: tables created before server_default have no column default
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(), index=True)
+    # Stamped by the database (see create_updated_at_trigger), so bulk UPDATEs keep it current
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=func.now(),
+                           server_onupdate=FetchedValue())
     last_attendance = db.Column(db.DateTime, nullable=True)  # Last attendance date
     
     # Status
     is_active = db.Column(db.Boolean, default=True)         # Active/Inactive student
     graduation_year = db.Column(db.Integer, nullable=True)   # Expected graduation
     
+    # Partial index: only active students are indexed, which is what listings filter on
+    __table_args__ = (
+        db.Index('idx_student_active', 'is_active',
+                 postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active')),
+    )
+    
     # Relationships
-    attendance_records = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan')
-    photo_metadata = db.relationship('PhotoMetadata', backref='student', lazy=True, cascade='all, delete-orphan')
+    # Child rows are removed by ON DELETE CASCADE; passive_deletes keeps the ORM
+    # from loading them just to delete them one by one
+    attendance_records = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    photo_metadata = db.relationship('PhotoMetadata', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    photo = db.relationship('StudentPhoto', backref='student', uselist=False, lazy='select', cascade='all, delete-orphan', passive_deletes=True)
+    
+    # Read/write the photo columns as if they were still on Student; the
+    # StudentPhoto row is created on first assignment
+    photo_blob = association_proxy('photo', 'photo_blob', creator=lambda photo_blob: StudentPhoto(photo_blob=photo_blob))
+    photo_hash = association_proxy('photo', 'photo_hash', creator=lambda photo_hash: StudentPhoto(photo_hash=photo_hash))
     
     def __repr__(self):
         return f'<Student {self.name} ({self.roll_number})>'
     
     def generate_secure_token(self):
         """Generate a new secure token for the student"""
-        self.secure_token = hashlib.sha256(
-            f"{self.roll_number}{secrets.token_hex(16)}{datetime.utcnow().isoformat()}".encode()
-        ).hexdigest()[:32]
+        # 192 random bits as 32 URL-safe characters; hashing would add no entropy
+        self.secure_token = secrets.token_urlsafe(24)
+    
+    @property
+    def face_vector(self):
+        """Face encoding as a read-only float32 array (no copy), or None"""
+        if self.face_encoding is None:
+            return None
+        return np.frombuffer(self.face_encoding, dtype=np.float32)
+    
+    @face_vector.setter
+    def face_vector(self, vector):
+        """Store a face encoding as FACE_ENCODING_SIZE float32 values"""
+        if vector is None:
+            self.face_encoding = None
+            return
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        if vector.shape != (FACE_ENCODING_SIZE,):
+            raise ValueError(f"Face encoding must have shape ({FACE_ENCODING_SIZE},), got {vector.shape}")
+        self.face_encoding = vector.tobytes()
     
     def set_photo_blob(self, photo_data):
-        """Set photo data and calculate hash"""
-        self.photo_blob = photo_data
-        self.photo_hash = hashlib.sha256(photo_data).hexdigest()
+        """Set photo data and start hashing it in the background"""
+        if self.photo is None:
+            self.photo = StudentPhoto(photo_blob=photo_data)
+        else:
+            self.photo.photo_blob = photo_data
+        # photo_hash is filled in from this future before the next flush
+        self.photo._hash_future = _hash_pool.submit(_sha256_hex, photo_data)
     
     def get_photo_base64(self):
         """Get photo as base64 string for display"""
-        if self.photo_blob:
-            return base64.b64encode(self.photo_blob).decode('utf-8')
+        photo = self.photo
+        if photo is not None and photo.photo_blob:
+            photo.resolve_hash()
+            # Encode once per photo version; the cache is dropped when the bytes change
+            if photo._base64_cache is None or photo._base64_cache[0] != photo.photo_hash:
+                photo._base64_cache = (photo.photo_hash, base64.b64encode(photo.photo_blob).decode('ascii'))
+            return photo._base64_cache[1]
         return None
     
     def verify_photo_integrity(self):
         """Verify photo data integrity using hash"""
-        if self.photo_blob and self.photo_hash:
-            current_hash = hashlib.sha256(self.photo_blob).hexdigest()
-            return current_hash == self.photo_hash
+        photo = self.photo
+        if photo is not None:
+            photo.resolve_hash()
+        if photo is not None and photo.photo_blob and photo.photo_hash:
+            # Skip rehashing bytes already verified against this hash
+            if photo._verified_hash == photo.photo_hash:
+                return True
+            current_hash = hashlib.sha256(photo.photo_blob).hexdigest()
+            if current_hash == photo.photo_hash:
+                photo._verified_hash = current_hash
+                return True
         return False
     
     def to_dict(self):
@@ -92,16 +159,91 @@ class Student(db.Model):
             'phone_number': self.phone_number,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'is_active': self.is_active,
-            'has_photo': bool(self.photo_blob),
-            'has_face_encoding': bool(self.face_encoding)
+            'has_photo': self.has_photo,
+            'has_face_encoding': self.has_face_encoding
         }
 
+class StudentPhoto(db.Model):
+    """Photo data for a student, kept out of the student row so listings stay small"""
+    __tablename__ = 'student_photo'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), primary_key=True)
+    photo_blob = deferred(db.Column(db.LargeBinary, nullable=True), group='photo')  # Photo data (loaded on access)
+    photo_hash = db.Column(db.String(64), nullable=True)    # SHA-256 hash for integrity
+    
+    # Hash that photo_blob was last verified against, the (photo_hash,
+    # base64 text) last produced by get_photo_base64, and the pending
+    # background hash of photo_blob (none of these are stored)
+    _verified_hash = None
+    _base64_cache = None
+    _hash_future = None
+    
+    def __repr__(self):
+        return f'<StudentPhoto for Student {self.student_id}>'
+    
+    def resolve_hash(self):
+        """Wait for a pending background hash and store it in photo_hash"""
+        future = self._hash_future
+        if future is not None:
+            self._hash_future = None
+            self.photo_hash = future.result()
+            # The hash was just computed from these bytes
+            self._verified_hash = self.photo_hash
+    
+    @classmethod
+    def open_photo_stream(cls, student_id, chunk_size=64 * 1024):
+        """Return a generator of photo chunks that never holds the whole photo (on SQLite)"""
+        # Resolve the engine now, while the app context is still active
+        engine = db.engine
+        
+        def generate():
+            with engine.connect() as conn:
+                raw_connection = conn.connection.dbapi_connection
+                
+                # SQLite incremental BLOB I/O (Python 3.11+); student_id is the rowid
+                if isinstance(raw_connection, sqlite3.Connection) and hasattr(raw_connection, 'blobopen'):
+                    with raw_connection.blobopen(cls.__tablename__, 'photo_blob', student_id, readonly=True) as blob:
+                        while True:
+                            chunk = blob.read(chunk_size)
+                            if not chunk:
+                                break
+                            yield chunk
+                    return
+                
+                # Other databases return the value whole; still hand it out in chunks
+                photo_blob = conn.execute(select(cls.photo_blob).where(cls.student_id == student_id)).scalar()
+                if photo_blob:
+                    view = memoryview(photo_blob)
+                    for start in range(0, len(view), chunk_size):
+                        yield bytes(view[start:start + chunk_size])
+        
+        return generate()
+
+@event.listens_for(StudentPhoto.photo_blob, 'set')
+def _reset_verified_hash(target, value, oldvalue, initiator):
+    """Changed photo bytes must be hashed and encoded again"""
+    target._verified_hash = None
+    target._base64_cache = None
+    target._hash_future = None
+
+@event.listens_for(Session, 'before_flush')
+def _resolve_photo_hashes(session, flush_context, instances):
+    """Fill in photo_hash for photos hashed in the background"""
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, StudentPhoto):
+            obj.resolve_hash()
+
+# Computed with an EXISTS subquery in the student SELECT, so no photo data is read
+Student.has_photo = column_property(
+    exists().where(StudentPhoto.student_id == Student.id, StudentPhoto.photo_blob.isnot(None))
+)
+
 class PhotoMetadata(db.Model):
     """Metadata for student photos"""
     __tablename__ = 'photo_metadata'
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False, index=True)
     
     # File Information
     filename = db.Column(db.String(255), nullable=False)
@@ -132,10 +274,10 @@ class Attendance(db.Model):
     __tablename__ = 'attendance'
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False, index=True)
     
     # Date and Time
-    date = db.Column(db.Date, nullable=False, default=date.today, index=True)
+    date = db.Column(db.Date, nullable=False, default=date.today)  # Indexed below, with status
     time_in = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     time_out = db.Column(db.DateTime, nullable=True)  # For tracking exit time
     
@@ -157,12 +299,33 @@ class Attendance(db.Model):
     notes = db.Column(db.Text, nullable=True)                # Special notes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Ensure one attendance record per student per day
-    __table_args__ = (db.UniqueConstraint('student_id', 'date', name='unique_attendance_per_day'),)
+    # Ensure one attendance record per student per day; the unique index leads
+    # with student_id, so daily rollups get their own date-leading index
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'date', name='unique_attendance_per_day'),
+        db.Index('idx_attendance_date_student', 'date', 'student_id'),
+        # Counts by date (and status) are answered from this index alone
+        db.Index('idx_attendance_date_status', 'date', 'status'),
+    )
     
     def __repr__(self):
         return f'<Attendance {self.student.name if self.student else "Unknown"} on {self.date}>'
     
+    @classmethod
+    def bulk_mark(cls, rows):
+        """Insert many attendance rows (dicts of column values) with one executemany"""
+        if not rows:
+            return 0
+        
+        # Skip waiting for the WAL flush on commit for this transaction on
+        # PostgreSQL; SQLite connections already run with synchronous=NORMAL
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text('SET LOCAL synchronous_commit TO OFF'))
+        
+        # Core insert: no ORM objects and no per-row flush
+        db.session.execute(cls.__table__.insert(), rows)
+        return len(rows)
+    
     def to_dict(self):
         """Convert attendance to dictionary"""
         return {
@@ -179,6 +342,15 @@ class Attendance(db.Model):
             'notes': self.notes
         }
 
+@event.listens_for(Attendance, 'before_insert')
+def _derive_attendance_date(mapper, connection, target):
+    """Take date from the same instant as time_in so the two cannot straddle midnight"""
+    if target.time_in is None:
+        target.time_in = datetime.utcnow()
+    if target.date is None:
+        # time_in is naive UTC; date is the school's local calendar day
+        target.date = target.time_in.replace(tzinfo=timezone.utc).astimezone().date()
+
 class DailyCode(db.Model):
     """Enhanced Daily verification codes"""
     __tablename__ = 'daily_code'
@@ -188,7 +360,7 @@ class DailyCode(db.Model):
     daily_code = db.Column(db.String(10), nullable=False)
     
     # Enhanced Security
-    code_hash = db.Column(db.String(64), nullable=True)      # Hash of the code
+    code_hash = db.Column(db.String(64), nullable=True, index=True)  # Hash of the code (set on write)
     usage_count = db.Column(db.Integer, default=0)           # How many times used
     max_usage = db.Column(db.Integer, default=1000)          # Maximum allowed usage
     
@@ -201,15 +373,24 @@ class DailyCode(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(100), nullable=True)    # Admin who generated
     
+    # Partial index: counting active codes reads only the active entries
+    __table_args__ = (
+        db.Index('idx_daily_code_active', 'id',
+                 postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active')),
+    )
+    
     def __repr__(self):
         return f'<DailyCode {self.daily_code} for {self.date}>'
     
+    @staticmethod
+    def hash_code(daily_code, code_date):
+        """Hash a code for a given date, as stored in code_hash"""
+        return hashlib.sha256(f"{daily_code}{code_date.isoformat()}".encode()).hexdigest()
+    
     def generate_code_hash(self):
         """Generate hash for the daily code"""
         if self.daily_code:
-            self.code_hash = hashlib.sha256(
-                f"{self.daily_code}{self.date.isoformat()}".encode()
-            ).hexdigest()
+            self.code_hash = self.hash_code(self.daily_code, self.date)
     
     def is_valid(self):
         """Check if the daily code is still valid"""
@@ -221,11 +402,28 @@ class DailyCode(db.Model):
             (not self.valid_until or now <= self.valid_until)
         )
     
-    def increment_usage(self):
-        """Increment usage count"""
-        self.usage_count += 1
-        if self.usage_count >= self.max_usage:
-            self.is_active = False
+    @classmethod
+    def increment_usage(cls, code_id):
+        """Atomically count one use of an active code, deactivating it at max_usage
+        
+        Returns True if the code was active and its use was counted.
+        """
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == code_id, cls.is_active == True)
+            .values(
+                usage_count=cls.usage_count + 1,
+                is_active=case((cls.usage_count + 1 >= cls.max_usage, False), else_=cls.is_active)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+@event.listens_for(DailyCode, 'before_insert')
+@event.listens_for(DailyCode, 'before_update')
+def _set_code_hash(mapper, connection, target):
+    """Keep code_hash in step with daily_code on every write"""
+    target.generate_code_hash()
 
 class AttendanceSession(db.Model):
     """Track attendance sessions and bulk operations"""
@@ -258,9 +456,8 @@ class AttendanceSession(db.Model):
     
     def generate_session_id(self):
         """Generate unique session ID"""
-        self.session_id = hashlib.sha256(
-            f"{datetime.utcnow().isoformat()}{secrets.token_hex(16)}".encode()
-        ).hexdigest()[:32]
+        # 192 random bits as 32 URL-safe characters; hashing would add no entropy
+        self.session_id = secrets.token_urlsafe(24)
 
 # Database utility functions
 def create_sample_data():
@@ -268,39 +465,158 @@ def create_sample_data():
     # This will be called only in development/demo mode
     pass
 
+# Attendance older than the hot window is moved here by archive_old_attendance,
+# keeping the attendance table and its indexes sized to recent days. The
+# archive has its own key: SQLite reuses attendance ids once that table is
+# emptied, so the original id is kept in attendance_id and is not unique
+attendance_archive = db.Table(
+    'attendance_archive',
+    db.Column('archive_id', db.Integer, primary_key=True, autoincrement=True),
+    db.Column('attendance_id', db.Integer, nullable=False),
+    db.Column('student_id', db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False),
+    db.Column('date', db.Date, nullable=False),
+    db.Column('time_in', db.DateTime, nullable=False),
+    db.Column('time_out', db.DateTime, nullable=True),
+    db.Column('status', db.String(20), nullable=False),
+    db.Column('method', db.String(20), nullable=False),
+    db.Column('confidence', db.Float, nullable=True),
+    db.Column('verification_code', db.String(10), nullable=True),
+    db.Column('verified_by', db.String(100), nullable=True),
+    db.Column('device_info', db.String(200), nullable=True),
+    db.Column('ip_address', db.String(45), nullable=True),
+    db.Column('location_info', db.String(200), nullable=True),
+    db.Column('notes', db.Text, nullable=True),
+    db.Column('created_at', db.DateTime),
+    db.Index('idx_attendance_archive_student_date', 'student_id', 'date'),
+)
+
+def _attendance_history_select():
+    """UNION ALL of the hot attendance table and attendance_archive"""
+    hot = Attendance.__table__
+    columns = [column.name for column in hot.columns if column.name != 'id']
+    return union_all(
+        select(hot.c.id.label('row_key'), false().label('archived'), hot.c.id.label('attendance_id'),
+               *(hot.c[name] for name in columns)),
+        select(attendance_archive.c.archive_id, true(), attendance_archive.c.attendance_id,
+               *(attendance_archive.c[name] for name in columns)),
+    ).subquery('attendance_history')
+
+class AttendanceHistory(db.Model):
+    """Read-only view over all attendance, recent and archived
+    
+    Use it for history and date-range queries; lookups of today's attendance
+    only need the Attendance table.
+    """
+    __table__ = _attendance_history_select()
+    __mapper_args__ = {'primary_key': [__table__.c.row_key, __table__.c.archived]}
+    
+    student = db.relationship(
+        'Student', primaryjoin='foreign(AttendanceHistory.student_id) == Student.id', viewonly=True
+    )
+    
+    def __repr__(self):
+        return f'<AttendanceHistory {self.student_id} on {self.date}>'
+
+def attendance_between(start, end, model=Attendance):
+    """Filter for attendance (or AttendanceHistory) on days in [start, end)
+    
+    Compares the indexed date column directly with a half-open range, so the
+    filter stays an index range scan (never wrap the column in DATE()).
+    """
+    return and_(model.date >= start, model.date < end)
+
+@lru_cache(maxsize=None)
+def _database_stats_statement():
+    """Core statement behind get_database_stats, built once and reused"""
+    # One round trip: conditional aggregates over student plus scalar
+    # subqueries for the other tables; today's date is a bound parameter
+    return select(
+        func.count(Student.id),
+        func.coalesce(func.sum(case((Student.is_active == True, 1), else_=0)), 0),
+        select(func.count()).select_from(StudentPhoto).where(StudentPhoto.photo_blob.isnot(None)).scalar_subquery(),
+        (select(func.count()).select_from(Attendance).scalar_subquery()
+         + select(func.count()).select_from(attendance_archive).scalar_subquery()),
+        select(func.count()).select_from(Attendance).where(
+            Attendance.date == bindparam('today', type_=db.Date)
+        ).scalar_subquery(),
+        select(func.count()).select_from(PhotoMetadata).scalar_subquery(),
+        select(func.count()).select_from(DailyCode).where(DailyCode.is_active == True).scalar_subquery()
+    ).select_from(Student)
+
 def get_database_stats():
     """Get database statistics"""
-    stats = {
-        'total_students': Student.query.count(),
-        'active_students': Student.query.filter_by(is_active=True).count(),
-        'students_with_photos': Student.query.filter(Student.photo_blob.isnot(None)).count(),
-        'total_attendance_records': Attendance.query.count(),
-        'attendance_today': Attendance.query.filter_by(date=date.today()).count(),
-        'total_photos': PhotoMetadata.query.count(),
-        'active_daily_codes': DailyCode.query.filter_by(is_active=True).count()
-    }
+    counts = db.session.execute(_database_stats_statement(), {'today': date.today()}).one()
+    
+    stats = dict(zip((
+        'total_students',
+        'active_students',
+        'students_with_photos',
+        'total_attendance_records',
+        'attendance_today',
+        'total_photos',
+        'active_daily_codes'
+    ), counts))
     return stats
 
+def _sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+def batch_verify_photos(students, max_workers=4):
+    """Verify the photo integrity of many students, hashing in parallel threads"""
+    # Touch the ORM on this thread only; hashlib releases the GIL for the hashing
+    photos = [student.photo for student in students]
+    pending = [
+        photo for photo in photos
+        if photo is not None and photo.photo_blob and photo.photo_hash
+        and photo._verified_hash != photo.photo_hash
+    ]
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = executor.map(_sha256_hex, [photo.photo_blob for photo in pending])
+        for photo, digest in zip(pending, digests):
+            if digest == photo.photo_hash:
+                photo._verified_hash = digest
+    
+    return [
+        photo is not None and photo.photo_hash is not None and photo._verified_hash == photo.photo_hash
+        for photo in photos
+    ]
+
+def archive_old_attendance(hot_days=90):
+    """Move attendance older than hot_days into attendance_archive"""
+    from datetime import timedelta
+    
+    cutoff_date = date.today() - timedelta(days=hot_days)
+    hot = Attendance.__table__
+    columns = [column.name for column in hot.columns if column.name != 'id']
+    
+    # INSERT ... SELECT then DELETE in one transaction; no rows pass through Python
+    db.session.execute(
+        attendance_archive.insert().from_select(
+            ['attendance_id'] + columns,
+            select(hot.c.id, *(hot.c[name] for name in columns)).where(hot.c.date < cutoff_date)
+        )
+    )
+    moved = db.session.execute(delete(Attendance.__table__).where(Attendance.date < cutoff_date)).rowcount
+    
+    db.session.commit()
+    return moved
+
 def cleanup_old_data(days_to_keep=365):
     """Clean up old data (keep only specified number of days)"""
     from datetime import timedelta
     
     cutoff_date = date.today() - timedelta(days=days_to_keep)
     
-    # Remove old attendance records
-    old_attendance = Attendance.query.filter(Attendance.date < cutoff_date).all()
-    for record in old_attendance:
-        db.session.delete(record)
-    
-    # Remove old daily codes
-    old_codes = DailyCode.query.filter(DailyCode.date < cutoff_date).all()
-    for code in old_codes:
-        db.session.delete(code)
-    
-    # Remove old sessions
-    old_sessions = AttendanceSession.query.filter(AttendanceSession.session_date < cutoff_date).all()
-    for session in old_sessions:
-        db.session.delete(session)
+    # One DELETE per table, run in the database and committed together
+    deleted = Attendance.query.filter(Attendance.date < cutoff_date).delete(synchronize_session=False)
+    deleted += DailyCode.query.filter(DailyCode.date < cutoff_date).delete(synchronize_session=False)
+    deleted += AttendanceSession.query.filter(
+        AttendanceSession.session_date < cutoff_date
+    ).delete(synchronize_session=False)
+    deleted += db.session.execute(
+        delete(attendance_archive).where(attendance_archive.c.date < cutoff_date)
+    ).rowcount
     
     db.session.commit()
-    return len(old_attendance) + len(old_codes) + len(old_sessions)
\ No newline at end of file
+    return deleted
\ No newline at end of file
@@ -7,19 +7,63 @@ import cv2
 import numpy as np
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
+import torch.nn.functional as F
 from facenet_pytorch import MTCNN, InceptionResnetV1
 import sqlite3
-import pickle
 import os
 from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from collections import deque
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from datetime import datetime, date
 import json
 import base64
-from PIL import Image
 import io
 
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# Dimension of FaceNet / ensemble embeddings
+EMBEDDING_SIZE = 512
+
+# Photos decoded and embedded together by train_on_student_data
+TRAINING_BATCH_SIZE = 16
+
+# Length of the landmark feature vector (MTCNN's 5 points, x and y)
+LANDMARK_FEATURE_SIZE = 10
+
+# Layout of ensemble embeddings, saved with the model; bump whenever
+# _combine_embeddings changes, since stored embeddings then no longer match
+# (1: tiled 136-d landmarks, 2: seeded projection of the 5-point landmarks)
+EMBEDDING_VERSION = 2
+
+@dataclass(slots=True)
+class Face:
+    """A face found by detect_faces; arrays stay numpy until an API boundary"""
+    bbox: np.ndarray          # [x, y, width, height] in the frame (int)
+    confidence: float
+    landmarks: np.ndarray     # MTCNN's 5 (x, y) points in the frame
+    face_region: np.ndarray   # View of the frame inside bbox (BGR)
+    face_id: str
+    
+    @property
+    def face_landmarks(self) -> np.ndarray:
+        """Landmarks relative to face_region"""
+        return self.landmarks - self.bbox[:2]
+
 class ProfessionalFaceRecognizer:
     """
     Production-ready face recognition system with multiple models
@@ -33,14 +77,37 @@ class ProfessionalFaceRecognizer:
             device: 'cuda' for GPU or 'cpu'
         """
         self.device = torch.device(device if torch.cuda.is_available() else 'cpu')
+        
+        # Dedicated CUDA stream for host-to-device frame copies
+        self._upload_stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
         self.logger = self._setup_logging()
         
         # Initialize models
         self.mtcnn = None
         self.facenet = None
+        self.facenet_dtype = torch.float32
+        self.facenet_session = None  # onnxruntime session, used instead of self.facenet when set
         self.arcface = None
         self.similarity_threshold = 0.6
         self.confidence_threshold = 0.8
+        self.embedding_version = EMBEDDING_VERSION  # Of the stored embeddings the loaded model was trained on
+        
+        # One instance is shared by every thread (see get_recognizer); this
+        # guards the settings and matching caches that methods below replace
+        self._lock = threading.Lock()
+        
+        # Stacked unit-norm student embeddings, rebuilt when a different
+        # student database list is passed to identify_student
+        self._db_source = None
+        self._db_source_len = 0
+        self._db_matrix = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        self._db_students = []
+        
+        # Above this many students, matching uses an HNSW index (if faiss is
+        # installed) instead of the exact matrix product
+        self.ann_min_students = 5000
+        self._ann_source = None
+        self._ann_index = None
         
         # Model ensemble weights
         self.model_weights = {
@@ -49,6 +116,13 @@ class ProfessionalFaceRecognizer:
             'landmarks': 0.2
         }
         
+        # Fixed random projection of landmark features to EMBEDDING_SIZE
+        # (seeded, so embeddings of one EMBEDDING_VERSION stay comparable across runs)
+        rng = np.random.default_rng(0)
+        self._landmark_proj = (
+            rng.standard_normal((EMBEDDING_SIZE, LANDMARK_FEATURE_SIZE)) / np.sqrt(LANDMARK_FEATURE_SIZE)
+        ).astype(np.float32)
+        
         self._initialize_models()
         
     def _setup_logging(self):
@@ -66,6 +140,10 @@ class ProfessionalFaceRecognizer:
     def _initialize_models(self):
         """Initialize all face recognition models"""
         try:
+            # Inputs have fixed shapes (160x160 faces), so let cuDNN pick the
+            # fastest convolution algorithms once
+            torch.backends.cudnn.benchmark = True
+            
             # 1. MTCNN for face detection
             self.logger.info("Loading MTCNN face detector...")
             self.mtcnn = MTCNN(
@@ -82,8 +160,14 @@ class ProfessionalFaceRecognizer:
             self.logger.info("Loading FaceNet model...")
             self.facenet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
             
-            # 3. Initialize landmark-based features
-            self._initialize_landmark_detector()
+            # Both models take OpenCV's BGR order directly, so frames are
+            # never converted to RGB
+            for conv in (self.mtcnn.pnet.conv1, self.mtcnn.rnet.conv1, self.mtcnn.onet.conv1,
+                         self.facenet.conv2d_1a.conv):
+                self._swap_input_channels(conv)
+            
+            self._initialize_onnx_facenet()
+            self._optimize_facenet()
             
             self.logger.info("✅ All models loaded successfully!")
             
@@ -91,36 +175,127 @@ class ProfessionalFaceRecognizer:
             self.logger.error(f"❌ Error initializing models: {e}")
             raise
     
-    def _initialize_landmark_detector(self):
-        """Initialize facial landmark detector"""
+    def _initialize_onnx_facenet(self, onnx_path: str = 'facenet_bgr.onnx'):
+        """Serve FaceNet through onnxruntime when it is installed, exporting the model once"""
+        if not ONNXRUNTIME_AVAILABLE:
+            return
+        
         try:
-            import dlib
-            
-            # Download shape predictor if not exists
-            predictor_path = "shape_predictor_68_face_landmarks.dat"
-            if not os.path.exists(predictor_path):
-                self.logger.warning("Downloading facial landmark predictor...")
-                import urllib.request
-                url = "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2"
-                urllib.request.urlretrieve(url, "shape_predictor_68_face_landmarks.dat.bz2")
-                
-                # Extract bz2 file
-                import bz2
-                with bz2.BZ2File("shape_predictor_68_face_landmarks.dat.bz2", 'rb') as f:
-                    with open(predictor_path, 'wb') as out:
-                        out.write(f.read())
-                
-                os.remove("shape_predictor_68_face_landmarks.dat.bz2")
+            if not os.path.exists(onnx_path):
+                self.logger.info("Exporting FaceNet to ONNX...")
+                dummy_input = torch.randn(1, 3, 160, 160, device=self.device)
+                torch.onnx.export(
+                    self.facenet, dummy_input, onnx_path,
+                    input_names=['input'], output_names=['embedding'],
+                    opset_version=17,
+                    dynamic_axes={'input': {0: 'B'}, 'embedding': {0: 'B'}}
+                )
+            
+            # Best available accelerator first, CPU as the last resort
+            available = ort.get_available_providers()
+            providers = [
+                provider for provider in (
+                    'TensorrtExecutionProvider', 'CUDAExecutionProvider',
+                    'CoreMLExecutionProvider', 'CPUExecutionProvider'
+                )
+                if provider in available
+            ]
+            self.facenet_session = ort.InferenceSession(onnx_path, providers=providers)
+            self.logger.info(f"FaceNet running on onnxruntime ({self.facenet_session.get_providers()[0]})")
+            
+        except Exception as e:
+            self.logger.warning(f"onnxruntime FaceNet unavailable, using PyTorch: {e}")
+            self.facenet_session = None
+    
+    def _optimize_facenet(self):
+        """Run FaceNet in FP16 on CUDA (int8 Linear layers on CPU) as a frozen TorchScript graph"""
+        if self.facenet_session is not None:
+            return  # onnxruntime serves FaceNet
+        
+        # Half precision halves weight traffic and uses Tensor Cores; CPUs stay FP32
+        self.facenet_dtype = torch.float16 if self.device.type == 'cuda' else torch.float32
+        self.facenet = self.facenet.to(dtype=self.facenet_dtype)
+        
+        if self.device.type == 'cpu':
+            self._quantize_facenet()
+        
+        try:
+            example = torch.randn(1, 3, 160, 160, device=self.device, dtype=self.facenet_dtype)
+            with torch.no_grad():
+                self.facenet = torch.jit.freeze(torch.jit.trace(self.facenet, example))
+        except Exception as e:
+            self.logger.warning(f"TorchScript conversion failed, using eager FaceNet: {e}")
+    
+    def _quantize_facenet(self, min_similarity: float = 0.99):
+        """Use dynamic int8 Linear layers on CPU if embeddings stay close to FP32"""
+        try:
+            # Dynamic quantization covers Linear layers; Conv2d stays FP32
+            quantized = torch.quantization.quantize_dynamic(self.facenet, {nn.Linear}, dtype=torch.qint8)
+            
+            # Compare against the FP32 model on a fixed probe batch
+            probe = torch.rand(4, 3, 160, 160, generator=torch.Generator().manual_seed(0)) * 2 - 1
+            with torch.inference_mode():
+                similarity = F.cosine_similarity(self.facenet(probe), quantized(probe)).min().item()
             
-            self.face_detector = dlib.get_frontal_face_detector()
-            self.landmark_predictor = dlib.shape_predictor(predictor_path)
+            if similarity >= min_similarity:
+                self.facenet = quantized
+                self.logger.info(f"FaceNet quantized to int8 (cosine similarity to FP32 {similarity:.4f})")
+            else:
+                self.logger.warning(f"Keeping FP32 FaceNet: int8 cosine similarity {similarity:.4f} < {min_similarity}")
+                
+        except Exception as e:
+            self.logger.warning(f"FaceNet quantization failed, using FP32: {e}")
+    
+    @staticmethod
+    def _swap_input_channels(conv: nn.Conv2d):
+        """Reverse the input channel order of a first conv layer (RGB weights -> BGR input)"""
+        with torch.no_grad():
+            conv.weight.copy_(conv.weight[:, [2, 1, 0]].clone())
+    
+    def _to_bgr(self, image) -> np.ndarray:
+        """Return a BGR numpy array for a frame (unchanged, no copy) or a PIL image"""
+        if isinstance(image, np.ndarray):
+            return image
+        return np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+    
+    def _frames_tensor(self, frames_bgr: np.ndarray) -> torch.Tensor:
+        """Upload BGR frame(s) as a uint8 tensor for MTCNN, which resizes and normalizes them on the device"""
+        tensor = torch.from_numpy(np.ascontiguousarray(frames_bgr))
+        if self._upload_stream is not None:
+            # Pinned host memory lets the copy run asynchronously on its own
+            # stream, overlapping with work already queued on the compute stream
+            host = tensor.pin_memory()
+            with torch.cuda.stream(self._upload_stream):
+                tensor = host.to(self.device, non_blocking=True)
             
-        except ImportError:
-            self.logger.warning("Dlib not available. Using fallback landmark detection.")
-            self.face_detector = None
-            self.landmark_predictor = None
+            # MTCNN runs on the current stream: wait for this copy only
+            compute_stream = torch.cuda.current_stream(self.device)
+            compute_stream.wait_stream(self._upload_stream)
+            tensor.record_stream(compute_stream)
+        return tensor
     
-    def detect_faces(self, image: np.ndarray) -> List[Dict]:
+    def _faces_from_detection(self, image_bgr: np.ndarray, boxes, probs, landmarks) -> List[Face]:
+        """Build Face records from one image's MTCNN output"""
+        faces = []
+        if boxes is not None:
+            height, width = image_bgr.shape[:2]
+            for i, (box, prob, landmark) in enumerate(zip(boxes, probs, landmarks)):
+                if prob > self.confidence_threshold:
+                    # Clip the box to the image
+                    x1, y1, x2, y2 = box.astype(int)
+                    x1, y1 = max(0, x1), max(0, y1)
+                    x2, y2 = min(width, x2), min(height, y2)
+                    
+                    faces.append(Face(
+                        bbox=np.array([x1, y1, x2 - x1, y2 - y1]),
+                        confidence=float(prob),
+                        landmarks=landmark,
+                        face_region=image_bgr[y1:y2, x1:x2],
+                        face_id=f"face_{i}"
+                    ))
+        return faces
+    
+    def detect_faces(self, image: np.ndarray) -> List[Face]:
         """
         Detect faces using MTCNN with high accuracy
         
@@ -131,38 +306,13 @@ class ProfessionalFaceRecognizer:
             List of detected faces with bounding boxes and landmarks
         """
         try:
-            # Convert to PIL Image
-            if isinstance(image, np.ndarray):
-                if image.shape[2] == 3:  # BGR to RGB
-                    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                else:
-                    image_rgb = image
-                pil_image = Image.fromarray(image_rgb)
-            else:
-                pil_image = image
+            image_bgr = self._to_bgr(image)
             
             # Detect faces with MTCNN
-            boxes, probs, landmarks = self.mtcnn.detect(pil_image, landmarks=True)
+            with torch.inference_mode():
+                boxes, probs, landmarks = self.mtcnn.detect(self._frames_tensor(image_bgr), landmarks=True)
             
-            faces = []
-            if boxes is not None:
-                for i, (box, prob, landmark) in enumerate(zip(boxes, probs, landmarks)):
-                    if prob > self.confidence_threshold:
-                        # Extract face region
-                        x1, y1, x2, y2 = box.astype(int)
-                        x1, y1 = max(0, x1), max(0, y1)
-                        x2, y2 = min(image_rgb.shape[1], x2), min(image_rgb.shape[0], y2)
-                        
-                        face_region = image_rgb[y1:y2, x1:x2]
-                        
-                        face_info = {
-                            'bbox': [x1, y1, x2-x1, y2-y1],
-                            'confidence': float(prob),
-                            'landmarks': landmark.tolist(),
-                            'face_region': face_region,
-                            'face_id': f"face_{i}"
-                        }
-                        faces.append(face_info)
+            faces = self._faces_from_detection(image_bgr, boxes, probs, landmarks)
             
             self.logger.info(f"🔍 MTCNN detected {len(faces)} faces")
             return faces
@@ -171,86 +321,169 @@ class ProfessionalFaceRecognizer:
             self.logger.error(f"❌ Face detection error: {e}")
             return []
     
-    def generate_face_embedding(self, face_region: np.ndarray) -> Optional[np.ndarray]:
+    def detect_faces_batch(self, images: List[np.ndarray]) -> List[List[Face]]:
         """
-        Generate high-quality face embedding using FaceNet
+        Detect faces in several frames with one batched MTCNN pass
         
         Args:
-            face_region: Cropped face image
+            images: Frames of the same size (e.g. consecutive camera frames)
             
         Returns:
-            512-dimensional face embedding
+            One list of detected faces per input frame
         """
+        if not images:
+            return []
+        
         try:
-            # Preprocess face for FaceNet
-            face_pil = Image.fromarray(face_region)
-            face_tensor = self._preprocess_face(face_pil)
+            images_bgr = [self._to_bgr(image) for image in images]
             
-            # Generate embedding
-            with torch.no_grad():
-                embedding = self.facenet(face_tensor.unsqueeze(0).to(self.device))
-                embedding = embedding.cpu().numpy().flatten()
+            # MTCNN only batches equally sized images
+            if len({image.shape for image in images_bgr}) > 1:
+                return [self.detect_faces(image) for image in images]
+            
+            # One (N, H, W, 3) upload for the whole batch
+            with torch.inference_mode():
+                boxes_list, probs_list, landmarks_list = self.mtcnn.detect(
+                    self._frames_tensor(np.stack(images_bgr)), landmarks=True
+                )
             
-            # L2 normalize
-            embedding = embedding / np.linalg.norm(embedding)
+            results = [
+                self._faces_from_detection(image_bgr, boxes, probs, landmarks)
+                for image_bgr, boxes, probs, landmarks in zip(images_bgr, boxes_list, probs_list, landmarks_list)
+            ]
             
-            return embedding
+            self.logger.info(f"🔍 MTCNN detected {sum(len(faces) for faces in results)} faces in {len(images)} frames")
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"❌ Batch face detection error: {e}")
+            return [[] for _ in images]
+    
+    def generate_face_embedding(self, face_region: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Generate high-quality face embedding using FaceNet
+        
+        Args:
+            face_region: Cropped BGR face image (from detect_faces)
+            
+        Returns:
+            512-dimensional face embedding
+        """
+        try:
+            # Preprocess face for FaceNet and generate (L2 normalized) embedding
+            return self._facenet_embeddings(self._preprocess_faces([face_region]))[0]
             
         except Exception as e:
             self.logger.error(f"❌ Embedding generation error: {e}")
             return None
     
-    def _preprocess_face(self, face_pil: Image.Image) -> torch.Tensor:
-        """Preprocess face image for neural network"""
-        transform = transforms.Compose([
-            transforms.Resize((160, 160)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-        ])
-        return transform(face_pil)
+    def generate_face_embeddings_batch(self, face_regions: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """
+        Generate FaceNet embeddings for several faces with one forward pass
+        
+        Args:
+            face_regions: Cropped BGR face images (from detect_faces)
+            
+        Returns:
+            One 512-dimensional embedding (or None) per face
+        """
+        if not face_regions:
+            return []
+        
+        try:
+            return list(self._facenet_embeddings(self._preprocess_faces(face_regions)))
+            
+        except Exception as e:
+            # e.g. an empty crop; embed faces one by one so the rest still succeed
+            self.logger.warning(f"⚠️ Batch embedding failed, embedding faces individually: {e}")
+            return [self.generate_face_embedding(face_region) for face_region in face_regions]
+    
+    def _facenet_embeddings(self, batch: torch.Tensor) -> np.ndarray:
+        """Run FaceNet on a preprocessed (K, 3, 160, 160) batch; returns (K, 512) unit-norm float32"""
+        if self.facenet_session is not None:
+            embeddings = self.facenet_session.run(None, {'input': batch.numpy()})[0]
+            return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        
+        with torch.inference_mode():
+            embeddings = self.facenet(batch.to(self.device, dtype=self.facenet_dtype, non_blocking=True))
+            # Back to FP32 before normalizing
+            return F.normalize(embeddings.float(), dim=1).cpu().numpy()
     
-    def extract_landmark_features(self, face_region: np.ndarray) -> Optional[np.ndarray]:
+    def _preprocess_faces(self, face_regions: List[np.ndarray]) -> torch.Tensor:
+        """Resize face crops to 160x160 and scale them to [-1, 1] as a (K, 3, 160, 160) float batch"""
+        if self.device.type == 'cuda' and self.facenet_session is None:
+            # Upload the raw uint8 crops; resize and normalize on the GPU
+            resized = [
+                F.interpolate(
+                    torch.from_numpy(np.ascontiguousarray(face_region)).to(self.device, non_blocking=True)
+                    .permute(2, 0, 1).unsqueeze(0).float(),
+                    size=(160, 160), mode='bilinear', align_corners=False
+                )
+                for face_region in face_regions
+            ]
+            return torch.cat(resized).div_(127.5).sub_(1.0)
+        
+        return torch.stack([self._preprocess_face(face_region) for face_region in face_regions])
+    
+    def _preprocess_face(self, face_region: np.ndarray) -> torch.Tensor:
+        """Resize a face crop to 160x160 and scale it to [-1, 1] as a CHW float tensor"""
+        face_160 = cv2.resize(face_region, (160, 160), interpolation=cv2.INTER_LINEAR)
+        return torch.from_numpy(face_160.transpose(2, 0, 1)).float().div_(255).sub_(0.5).div_(0.5)
+    
+    def extract_landmark_features(self, face_region: np.ndarray,
+                                  face_landmarks: Optional[np.ndarray]) -> Optional[np.ndarray]:
         """
-        Extract geometric features from facial landmarks
+        Extract geometric features from the landmarks MTCNN already found
         
         Args:
-            face_region: Cropped face image
+            face_region: Cropped BGR face image (from detect_faces)
+            face_landmarks: MTCNN's 5 landmark points, relative to face_region
             
         Returns:
             Landmark-based feature vector
         """
-        if self.face_detector is None or self.landmark_predictor is None:
-            return None
-            
+        return self.extract_landmark_features_batch([face_region], [face_landmarks])[0]
+    
+    def extract_landmark_features_batch(self, face_regions: List[np.ndarray],
+                                        face_landmarks: List[Optional[np.ndarray]]) -> List[Optional[np.ndarray]]:
+        """Landmark features for several faces, built in one vectorized pass"""
+        count = len(face_regions)
+        points = np.zeros((count, 5, 2), dtype=np.float32)
+        sizes = np.ones((count, 2), dtype=np.float32)
+        valid = np.zeros(count, dtype=bool)
+        
         try:
-            gray = cv2.cvtColor(face_region, cv2.COLOR_RGB2GRAY)
-            faces = self.face_detector(gray)
+            for i, (face_region, landmarks) in enumerate(zip(face_regions, face_landmarks)):
+                height, width = face_region.shape[:2]
+                if landmarks is not None and width > 0 and height > 0:
+                    points[i] = landmarks
+                    sizes[i] = (width, height)
+                    valid[i] = True
             
-            if len(faces) > 0:
-                landmarks = self.landmark_predictor(gray, faces[0])
-                
-                # Extract geometric features
-                features = []
-                for i in range(68):
-                    features.extend([landmarks.part(i).x, landmarks.part(i).y])
-                
-                # Normalize features
-                features = np.array(features, dtype=np.float32)
-                features = features / np.linalg.norm(features)
-                
-                return features
+            # Points as fractions of the face size, centered on their mean
+            points /= sizes[:, None, :]
+            points -= points.mean(axis=1, keepdims=True)
+            
+            # Normalize features
+            features = points.reshape(count, LANDMARK_FEATURE_SIZE)
+            norms = np.linalg.norm(features, axis=1)
+            valid &= norms > 0
+            features[valid] /= norms[valid, None]
             
         except Exception as e:
             self.logger.error(f"❌ Landmark extraction error: {e}")
+            return [None] * count
         
-        return None
+        return [features[i] if valid[i] else None for i in range(count)]
     
-    def generate_ensemble_embedding(self, face_region: np.ndarray) -> Optional[np.ndarray]:
+    def generate_ensemble_embedding(self, face_region: np.ndarray,
+                                    face_landmarks: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
         """
         Generate ensemble embedding combining multiple approaches
         
         Args:
-            face_region: Cropped face image
+            face_region: Cropped BGR face image (from detect_faces)
+            face_landmarks: MTCNN landmarks for the face ('face_landmarks' from detect_faces)
             
         Returns:
             Combined feature vector
@@ -264,7 +497,7 @@ class ProfessionalFaceRecognizer:
                 embeddings['facenet'] = facenet_emb
             
             # 2. Landmark features
-            landmark_features = self.extract_landmark_features(face_region)
+            landmark_features = self.extract_landmark_features(face_region, face_landmarks)
             if landmark_features is not None:
                 embeddings['landmarks'] = landmark_features
             
@@ -278,25 +511,62 @@ class ProfessionalFaceRecognizer:
         
         return None
     
+    def generate_ensemble_embeddings(self, faces: List[Face]) -> List[Optional[np.ndarray]]:
+        """
+        Generate ensemble embeddings for several faces, batching the FaceNet pass
+        
+        Args:
+            faces: Detected faces from detect_faces
+            
+        Returns:
+            One combined feature vector (or None) per face
+        """
+        if len(faces) <= 1:
+            return [
+                self.generate_ensemble_embedding(face.face_region, face.face_landmarks)
+                for face in faces
+            ]
+        
+        results = []
+        face_regions = [face.face_region for face in faces]
+        facenet_embs = self.generate_face_embeddings_batch(face_regions)
+        all_landmark_features = self.extract_landmark_features_batch(
+            face_regions, [face.face_landmarks for face in faces]
+        )
+        
+        for facenet_emb, landmark_features in zip(facenet_embs, all_landmark_features):
+            try:
+                embeddings = {}
+                if facenet_emb is not None:
+                    embeddings['facenet'] = facenet_emb
+                
+                if landmark_features is not None:
+                    embeddings['landmarks'] = landmark_features
+                
+                results.append(self._combine_embeddings(embeddings) if embeddings else None)
+                
+            except Exception as e:
+                self.logger.error(f"❌ Ensemble embedding error: {e}")
+                results.append(None)
+        
+        return results
+    
     def _combine_embeddings(self, embeddings: Dict) -> np.ndarray:
         """Combine multiple embeddings with learned weights"""
-        combined = []
+        result = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
         
         if 'facenet' in embeddings:
-            combined.append(embeddings['facenet'] * self.model_weights['facenet'])
+            np.multiply(embeddings['facenet'], self.model_weights['facenet'], out=result, casting='unsafe')
         
         if 'landmarks' in embeddings:
-            # Resize landmark features to match FaceNet dimension
-            landmarks = embeddings['landmarks']
-            if len(landmarks) != 512:
-                landmarks = np.resize(landmarks, 512)
-            combined.append(landmarks * self.model_weights['landmarks'])
+            # Project landmark features into the FaceNet dimension
+            result += self.model_weights['landmarks'] * (self._landmark_proj @ embeddings['landmarks'])
         
-        if combined:
-            result = np.sum(combined, axis=0)
-            return result / np.linalg.norm(result)  # L2 normalize
-        
-        return np.zeros(512)
+        # L2 normalize once, at the end
+        norm = np.linalg.norm(result)
+        if norm > 0:
+            result /= norm
+        return result
     
     def compare_faces(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
@@ -328,43 +598,50 @@ class ProfessionalFaceRecognizer:
             self.logger.error(f"❌ Face comparison error: {e}")
             return 0.0
     
-    def identify_student(self, image: np.ndarray, student_database: List[Dict]) -> List[Dict]:
+    def identify_student(self, image: np.ndarray, student_database: List[Dict],
+                         detected_faces: Optional[List[Face]] = None) -> List[Dict]:
         """
         Identify students in image against database
         
         Args:
             image: Input image
             student_database: List of student records with embeddings
+            detected_faces: Faces already found in image (e.g. by detect_faces_batch)
             
         Returns:
             List of identified students with confidence scores
         """
         try:
             # Detect faces
-            detected_faces = self.detect_faces(image)
+            if detected_faces is None:
+                detected_faces = self.detect_faces(image)
             identified_students = []
             
-            for face in detected_faces:
-                # Generate embedding for detected face
-                face_embedding = self.generate_ensemble_embedding(face['face_region'])
-                
+            # Generate embeddings for detected faces
+            faces = []
+            face_embeddings = []
+            all_embeddings = self.generate_ensemble_embeddings(detected_faces)
+            for face, face_embedding in zip(detected_faces, all_embeddings):
                 if face_embedding is not None:
+                    faces.append(face)
+                    face_embeddings.append(face_embedding)
+            
+            if faces:
+                best_rows, best_similarities, db_students = self._nearest_students(face_embeddings, student_database)
+                similarity_threshold = self.similarity_threshold  # One value for the whole frame
+                
+                for row, (face, face_embedding) in enumerate(zip(faces, face_embeddings)):
                     best_match = None
                     best_similarity = 0.0
                     
-                    # Compare with student database
-                    for student in student_database:
-                        if 'embedding' in student:
-                            similarity = self.compare_faces(face_embedding, student['embedding'])
-                            
-                            if similarity > best_similarity and similarity > self.similarity_threshold:
-                                best_similarity = similarity
-                                best_match = student
+                    if len(db_students) and best_rows[row] >= 0 and best_similarities[row] > similarity_threshold:
+                        best_similarity = float(best_similarities[row])
+                        best_match = db_students[best_rows[row]]
                     
                     # Add result
                     result = {
-                        'bbox': face['bbox'],
-                        'face_confidence': face['confidence'],
+                        'bbox': face.bbox,
+                        'face_confidence': face.confidence,
                         'similarity': best_similarity,
                         'identified': best_match is not None,
                         'student_info': best_match,
@@ -380,6 +657,72 @@ class ProfessionalFaceRecognizer:
             self.logger.error(f"❌ Student identification error: {e}")
             return []
     
+    def _nearest_students(self, face_embeddings: List[np.ndarray],
+                          student_database: List[Dict]) -> Tuple[np.ndarray, np.ndarray, List[Dict]]:
+        """Best matching student row and its 0-1 similarity for each face embedding"""
+        db_matrix, db_students = self._database_matrix(student_database)
+        if not len(db_students):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), db_students
+        
+        queries = np.ascontiguousarray(face_embeddings, dtype=np.float32)
+        index = self._ann_for(db_matrix)
+        
+        if index is not None:
+            # Inner product over unit-norm vectors is the cosine similarity
+            similarities, rows = index.search(queries, 1)
+            best_rows, best_similarities = rows[:, 0], similarities[:, 0]
+        else:
+            # All faces against all students in one GEMM; embeddings are
+            # unit-norm, so this is the cosine similarity
+            similarities = queries @ db_matrix.T
+            best_rows = np.argmax(similarities, axis=1)
+            best_similarities = similarities[np.arange(len(queries)), best_rows]
+        
+        # Map to 0-1
+        return best_rows, (best_similarities + 1) / 2, db_students
+    
+    def _ann_for(self, db_matrix: np.ndarray):
+        """HNSW inner-product index over db_matrix, or None to use the exact search"""
+        if not FAISS_AVAILABLE or len(db_matrix) < self.ann_min_students:
+            return None
+        
+        with self._lock:
+            if self._ann_source is not db_matrix:
+                index = faiss.IndexHNSWFlat(EMBEDDING_SIZE, 32, faiss.METRIC_INNER_PRODUCT)
+                index.add(np.ascontiguousarray(db_matrix, dtype=np.float32))
+                self._ann_source = db_matrix
+                self._ann_index = index
+            
+            return self._ann_index
+    
+    def _database_matrix(self, student_database: List[Dict]) -> Tuple[np.ndarray, List[Dict]]:
+        """Return the (N, 512) unit-norm embedding matrix for student_database and its rows' students"""
+        # Databases loaded from the embedding cache come with their matrix
+        if isinstance(student_database, StudentDatabase) and student_database.matrix is not None:
+            return student_database.matrix, student_database.matrix_students
+        
+        with self._lock:
+            if student_database is not self._db_source or len(student_database) != self._db_source_len:
+                # Embeddings of another size (e.g. 128-d MediaPipe encodings) can never match
+                students = [
+                    student for student in student_database
+                    if 'embedding' in student and np.size(student['embedding']) == EMBEDDING_SIZE
+                ]
+                matrix = np.empty((len(students), EMBEDDING_SIZE), dtype=np.float32)
+                for i, student in enumerate(students):
+                    matrix[i] = np.ravel(student['embedding'])
+                
+                # Normalize rows once; zero rows never match (as in compare_faces)
+                norms = np.linalg.norm(matrix, axis=1)
+                nonzero = norms > 0
+                
+                self._db_source = student_database
+                self._db_source_len = len(student_database)
+                self._db_matrix = np.ascontiguousarray(matrix[nonzero] / norms[nonzero, None])
+                self._db_students = [student for student, keep in zip(students, nonzero) if keep]
+            
+            return self._db_matrix, self._db_students
+    
     def train_on_student_data(self, student_photos: List[Dict]) -> Dict:
         """
         Train/optimize the model on student photos
@@ -393,46 +736,63 @@ class ProfessionalFaceRecognizer:
         try:
             self.logger.info("🎓 Starting model training on student data...")
             
-            training_data = []
             student_embeddings = {}
+            embeddings_by_student = {student['id']: [] for student in student_photos}
             
-            # Process each student's photos
-            for student in student_photos:
-                student_id = student['id']
-                name = student['name']
-                photos = student.get('photos', [])
-                
-                embeddings = []
+            # Every (student, photo) pair, processed TRAINING_BATCH_SIZE at a time
+            photo_items = [
+                (student['id'], photo_data)
+                for student in student_photos
+                for photo_data in student.get('photos', [])
+            ]
+            chunks = [
+                photo_items[i:i + TRAINING_BATCH_SIZE]
+                for i in range(0, len(photo_items), TRAINING_BATCH_SIZE)
+            ]
+            
+            # Decode the next chunk of photos in worker threads (cv2 releases
+            # the GIL) while the current chunk runs through the models
+            with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+                next_images = [pool.submit(_decode_photo, photo_data) for _, photo_data in chunks[0]] if chunks else []
                 
-                for photo_data in photos:
-                    # Load photo
-                    if isinstance(photo_data, bytes):
-                        image = cv2.imdecode(np.frombuffer(photo_data, np.uint8), cv2.IMREAD_COLOR)
-                    else:
-                        image = photo_data
+                for i, chunk in enumerate(chunks):
+                    images = [future.result() for future in next_images]
+                    if i + 1 < len(chunks):
+                        next_images = [pool.submit(_decode_photo, photo_data) for _, photo_data in chunks[i + 1]]
                     
-                    # Detect faces and generate embeddings
-                    faces = self.detect_faces(image)
-                    for face in faces:
-                        embedding = self.generate_ensemble_embedding(face['face_region'])
+                    # Detect faces, then embed all faces of the chunk in one batch
+                    owners = []
+                    faces = []
+                    decoded = [(student_id, image) for (student_id, _), image in zip(chunk, images) if image is not None]
+                    for (student_id, _), image_faces in zip(decoded, self.detect_faces_batch([image for _, image in decoded])):
+                        owners.extend([student_id] * len(image_faces))
+                        faces.extend(image_faces)
+                    
+                    for student_id, embedding in zip(owners, self.generate_ensemble_embeddings(faces)):
                         if embedding is not None:
-                            embeddings.append(embedding)
+                            embeddings_by_student[student_id].append(embedding)
+            
+            for student in student_photos:
+                student_id = student['id']
+                embeddings = embeddings_by_student[student_id]
                 
                 if embeddings:
                     # Average embeddings for the student
-                    avg_embedding = np.mean(embeddings, axis=0)
+                    avg_embedding = np.stack(embeddings).mean(axis=0)
                     avg_embedding = avg_embedding / np.linalg.norm(avg_embedding)
                     
                     student_embeddings[student_id] = {
                         'id': student_id,
-                        'name': name,
+                        'name': student['name'],
                         'embedding': avg_embedding,
                         'num_photos': len(embeddings)
                     }
             
             # Optimize similarity threshold based on student data
             optimized_threshold = self._optimize_threshold(student_embeddings)
-            self.similarity_threshold = optimized_threshold
+            with self._lock:
+                self.similarity_threshold = optimized_threshold
+                self.embedding_version = EMBEDDING_VERSION
             
             training_results = {
                 'students_processed': len(student_embeddings),
@@ -451,22 +811,19 @@ class ProfessionalFaceRecognizer:
     def _optimize_threshold(self, student_embeddings: Dict) -> float:
         """Optimize similarity threshold based on student data"""
         try:
-            similarities = []
-            
-            # Calculate intra-class similarities (same student)
-            for student_id, student_data in student_embeddings.items():
-                embedding = student_data['embedding']
+            # Inter-class similarities need at least two students
+            if len(student_embeddings) > 1:
+                # Every pair of different students from one GEMM; embeddings
+                # are unit-norm, so S holds their cosine similarities
+                embeddings = np.stack([
+                    np.ravel(student_data['embedding']) for student_data in student_embeddings.values()
+                ]).astype(np.float32)
+                S = embeddings @ embeddings.T
+                similarities = (S[~np.eye(len(embeddings), dtype=bool)] + 1) * 0.5
                 
-                # Compare with other students (inter-class)
-                for other_id, other_data in student_embeddings.items():
-                    if student_id != other_id:
-                        similarity = self.compare_faces(embedding, other_data['embedding'])
-                        similarities.append(similarity)
-            
-            if similarities:
                 # Set threshold as mean + 2*std to minimize false positives
-                mean_sim = np.mean(similarities)
-                std_sim = np.std(similarities)
+                mean_sim = float(similarities.mean())
+                std_sim = float(similarities.std())
                 optimal_threshold = min(0.8, max(0.4, mean_sim + 2 * std_sim))
                 
                 self.logger.info(f"📊 Similarity stats - Mean: {mean_sim:.3f}, Std: {std_sim:.3f}, Threshold: {optimal_threshold:.3f}")
@@ -478,16 +835,17 @@ class ProfessionalFaceRecognizer:
         return 0.6  # Default threshold
     
     def save_model(self, filepath: str):
-        """Save trained model and parameters"""
+        """Save trained model parameters as JSON"""
         try:
             model_data = {
                 'similarity_threshold': self.similarity_threshold,
                 'model_weights': self.model_weights,
-                'confidence_threshold': self.confidence_threshold
+                'confidence_threshold': self.confidence_threshold,
+                'embedding_version': self.embedding_version
             }
             
-            with open(filepath, 'wb') as f:
-                pickle.dump(model_data, f)
+            with open(filepath, 'w') as f:
+                json.dump(model_data, f, indent=2)
             
             self.logger.info(f"💾 Model saved to {filepath}")
             
@@ -495,23 +853,162 @@ class ProfessionalFaceRecognizer:
             self.logger.error(f"❌ Model save error: {e}")
     
     def load_model(self, filepath: str):
-        """Load trained model and parameters"""
+        """Load trained model parameters saved by save_model"""
         try:
-            with open(filepath, 'rb') as f:
-                model_data = pickle.load(f)
+            with open(filepath) as f:
+                model_data = _validate_model_data(json.load(f))
             
-            self.similarity_threshold = model_data.get('similarity_threshold', 0.6)
-            self.model_weights = model_data.get('model_weights', self.model_weights)
-            self.confidence_threshold = model_data.get('confidence_threshold', 0.8)
+            with self._lock:
+                self.similarity_threshold = model_data.get('similarity_threshold', 0.6)
+                self.model_weights = model_data.get('model_weights', self.model_weights)
+                self.confidence_threshold = model_data.get('confidence_threshold', 0.8)
+                # Files written before versioning describe version 1 embeddings
+                self.embedding_version = model_data.get('embedding_version', 1)
+            
+            if self.embedding_version != EMBEDDING_VERSION:
+                self.logger.warning(
+                    f"⚠️ Model was trained on version {self.embedding_version} embeddings "
+                    f"(current: {EMBEDDING_VERSION}); stored face encodings must be regenerated"
+                )
             
             self.logger.info(f"📂 Model loaded from {filepath}")
             
         except Exception as e:
             self.logger.error(f"❌ Model load error: {e}")
 
+def _validate_model_data(model_data) -> Dict:
+    """Check a loaded model file against the save_model schema"""
+    if not isinstance(model_data, dict):
+        raise ValueError("model file must contain a JSON object")
+    
+    for key in ('similarity_threshold', 'confidence_threshold'):
+        value = model_data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1):
+            raise ValueError(f"{key} must be a number between 0 and 1")
+    
+    version = model_data.get('embedding_version')
+    if version is not None and (isinstance(version, bool) or not isinstance(version, int)):
+        raise ValueError("embedding_version must be an integer")
+    
+    weights = model_data.get('model_weights')
+    if weights is not None:
+        if not isinstance(weights, dict) or not all(
+            isinstance(name, str) and isinstance(weight, (int, float)) and not isinstance(weight, bool)
+            for name, weight in weights.items()
+        ):
+            raise ValueError("model_weights must map model names to numbers")
+    
+    return model_data
+
 # Utility functions for integration
-def create_student_database_from_sqlite(db_path: str) -> List[Dict]:
-    """Load student database with embeddings"""
+@lru_cache(maxsize=None)
+def get_recognizer(device: str = 'cpu') -> ProfessionalFaceRecognizer:
+    """Shared recognizer per device, so MTCNN and FaceNet are loaded once per process
+    
+    Its methods may run on several threads at once; load_model, training and
+    the matching caches update shared state under the recognizer's lock.
+    """
+    return ProfessionalFaceRecognizer(device)
+
+def _decode_photo(photo_data) -> Optional[np.ndarray]:
+    """Decode encoded photo bytes to a BGR image; arrays are returned as they are"""
+    if isinstance(photo_data, bytes):
+        return cv2.imdecode(np.frombuffer(photo_data, np.uint8), cv2.IMREAD_COLOR)
+    return photo_data
+
+class StudentDatabase(list):
+    """Student records plus the stacked unit-norm matrix of their matchable embeddings"""
+    
+    def __init__(self, students=(), matrix=None, matrix_students=None):
+        super().__init__(students)
+        self.matrix = matrix                          # (N, 512) float32, usually memory-mapped
+        self.matrix_students = matrix_students or []  # Student record for each matrix row
+
+def _sqlite_mtime(db_path: str) -> float:
+    """Last modification time of a SQLite database, including its WAL file"""
+    return max(os.path.getmtime(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+def _load_student_cache(db_path: str, cache_path: str, meta_path: str) -> Optional[StudentDatabase]:
+    """Load the embedding cache if it was built from the current database file"""
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if not isinstance(meta, dict):
+            return None
+        if meta.get('db_path') != os.path.abspath(db_path) or meta.get('db_mtime') != _sqlite_mtime(db_path):
+            return None
+        
+        # Pages of the matrix are read on demand
+        matrix = np.load(cache_path, mmap_mode='r')
+        students = _validate_student_records(meta.get('students'), len(matrix))
+    except (OSError, ValueError):
+        return None
+    
+    for student in students:
+        student['embedding'] = matrix[student.pop('_row')]
+    
+    return StudentDatabase(students, matrix, students)
+
+def _validate_student_records(records, num_rows: int) -> List[Dict]:
+    """Check cached student records against the _save_student_cache schema"""
+    if not isinstance(records, list):
+        raise ValueError("students must be a list")
+    
+    students = []
+    for record in records:
+        if not isinstance(record, dict) or set(record) != {'id', 'name', 'roll_number', '_row'}:
+            raise ValueError("student records must have id, name, roll_number and _row")
+        if isinstance(record['id'], bool) or not isinstance(record['id'], int):
+            raise ValueError("student id must be an integer")
+        if not isinstance(record['name'], str) or not isinstance(record['roll_number'], (str, type(None))):
+            raise ValueError("student name and roll_number must be strings")
+        row = record['_row']
+        if isinstance(row, bool) or not isinstance(row, int) or not 0 <= row < num_rows:
+            raise ValueError("_row must index the embedding matrix")
+        students.append(dict(record))
+    
+    return students
+
+def _save_student_cache(db_path: str, cache_path: str, meta_path: str, students: List[Dict]) -> StudentDatabase:
+    """Write matchable embeddings to a .npy matrix and their students' records to JSON"""
+    # Only unit-normalizable 512-d embeddings can be matched (see identify_student)
+    rows = [
+        student for student in students
+        if np.size(student['embedding']) == EMBEDDING_SIZE and np.any(student['embedding'])
+    ]
+    matrix = np.empty((len(rows), EMBEDDING_SIZE), dtype=np.float32)
+    for i, student in enumerate(rows):
+        matrix[i] = np.ravel(student['embedding'])
+    if len(rows):
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.save(cache_path, matrix)
+    
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'db_path': os.path.abspath(db_path),
+            'db_mtime': _sqlite_mtime(db_path),
+            'students': [
+                {'id': student['id'], 'name': student['name'], 'roll_number': student['roll_number'], '_row': i}
+                for i, student in enumerate(rows)
+            ]
+        }, f)
+    
+    return _load_student_cache(db_path, cache_path, meta_path) or StudentDatabase(students)
+
+def create_student_database_from_sqlite(db_path: str, cache_path: str = 'students.npy') -> List[Dict]:
+    """Load student database with embeddings
+    
+    Embeddings are cached in cache_path (plus a _meta.json file) and only
+    re-read from SQLite when the database file changes. Students whose
+    embedding can never match are left out of the cached database.
+    """
+    meta_path = os.path.splitext(cache_path)[0] + '_meta.json'
+    
+    if os.path.exists(db_path):
+        cached = _load_student_cache(db_path, cache_path, meta_path)
+        if cached is not None:
+            return cached
+    
     try:
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
@@ -523,7 +1020,7 @@ def create_student_database_from_sqlite(db_path: str) -> List[Dict]:
         ''')
         
         students = []
-        face_recognizer = ProfessionalFaceRecognizer()
+        face_recognizer = None
         
         for row in cursor.fetchall():
             student_id, name, roll_number, face_encoding, photo_data = row
@@ -533,11 +1030,15 @@ def create_student_database_from_sqlite(db_path: str) -> List[Dict]:
                 if face_encoding:
                     embedding = np.frombuffer(face_encoding, dtype=np.float32)
                 elif photo_data:
-                    # Generate new embedding from photo
+                    # Generate new embedding from photo (models are loaded only when needed)
+                    if face_recognizer is None:
+                        face_recognizer = get_recognizer()
                     image = cv2.imdecode(np.frombuffer(photo_data, np.uint8), cv2.IMREAD_COLOR)
                     faces = face_recognizer.detect_faces(image)
                     if faces:
-                        embedding = face_recognizer.generate_ensemble_embedding(faces[0]['face_region'])
+                        embedding = face_recognizer.generate_ensemble_embedding(
+                            faces[0].face_region, faces[0].face_landmarks
+                        )
                     else:
                         continue
                 else:
@@ -554,46 +1055,171 @@ def create_student_database_from_sqlite(db_path: str) -> List[Dict]:
                 print(f"Error processing student {name}: {e}")
         
         conn.close()
-        return students
+        
+        try:
+            return _save_student_cache(db_path, cache_path, meta_path, students)
+        except OSError as e:
+            print(f"Embedding cache not written: {e}")
+            return students
         
     except Exception as e:
         print(f"Database error: {e}")
         return []
 
+class FaceTracker:
+    """
+    Reuses identification results across video frames by following each
+    face with template matching, re-running detection only periodically
+    """
+    
+    def __init__(self, recognizer: ProfessionalFaceRecognizer, student_database: List[Dict],
+                 redetect_interval: int = 5, min_match_score: float = 0.6, search_margin: float = 0.5):
+        self.recognizer = recognizer
+        self.student_database = student_database
+        self.redetect_interval = redetect_interval  # Full detect at least every N frames
+        self.min_match_score = min_match_score      # Lowest TM_CCOEFF_NORMED score kept
+        self.search_margin = search_margin          # Search window padding, as a fraction of the box
+        
+        self._results = []
+        self._templates = []
+        self._frames_since_detect = redetect_interval  # Detect on the first frame
+    
+    def update(self, frame: np.ndarray) -> List[Dict]:
+        """Identification results for frame, with bboxes moved to the faces' new positions"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        # Frames are counted since the last detect whatever it found, so an
+        # empty scene is also only re-detected every redetect_interval frames
+        if self._frames_since_detect < self.redetect_interval:
+            tracked = self._track(gray)
+            if tracked is not None:
+                self._results = tracked
+                self._frames_since_detect += 1
+                return tracked
+        
+        # Re-detect: on schedule, or when a face was lost
+        self._results = self.recognizer.identify_student(frame, self.student_database)
+        self._templates = [
+            gray[y:y + h, x:x + w].copy() for x, y, w, h in (result['bbox'] for result in self._results)
+        ]
+        self._frames_since_detect = 0
+        return self._results
+    
+    def _track(self, gray: np.ndarray) -> Optional[List[Dict]]:
+        """Find every known face near its last box; None if any of them is lost"""
+        height, width = gray.shape
+        tracked = []
+        
+        for result, template in zip(self._results, self._templates):
+            x, y, w, h = map(int, result['bbox'])
+            if w == 0 or h == 0:
+                return None
+            
+            margin_x, margin_y = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+            x1, y1 = min(width, x + w + margin_x), min(height, y + h + margin_y)
+            window = gray[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                return None
+            
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, best_score, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if best_score < self.min_match_score:
+                return None
+            
+            moved = dict(result)
+            moved['bbox'] = [x0 + dx, y0 + dy, w, h]
+            tracked.append(moved)
+        
+        return tracked
+
+def _capture_frames(cap, frames: queue.Queue, stop: threading.Event):
+    """Read camera frames into a 2-slot buffer, dropping the oldest when it is full"""
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frames.full():
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+        frames.put(frame)
+    frames.put(None)
+
 if __name__ == "__main__":
     # Example usage
-    recognizer = ProfessionalFaceRecognizer()
+    recognizer = get_recognizer()
     
     # Load student database
     student_db = create_student_database_from_sqlite('attendance_enhanced.db')
     
-    # Test recognition
+    # Test recognition; capture runs in its own thread so cap.read() overlaps
+    # with detection and display (double-buffered)
     cap = cv2.VideoCapture(0)
+    captured_frames = queue.Queue(maxsize=2)
+    stop_capture = threading.Event()
+    capture_thread = threading.Thread(
+        target=_capture_frames, args=(cap, captured_frames, stop_capture), daemon=True
+    )
+    capture_thread.start()
+    
+    # Identification runs MTCNN once over the most recent frames
+    BATCH_SIZE = 8
+    recent_frames = deque(maxlen=BATCH_SIZE)
+    
+    # Live overlay: faces are followed between periodic re-detections
+    tracker = FaceTracker(recognizer, student_db)
     
     print("Professional Face Recognition System Ready!")
     print("Press SPACE to identify students, ESC to quit")
     
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        frame = captured_frames.get()
+        if frame is None:
             break
         
-        cv2.imshow('Professional Face Recognition', frame)
+        recent_frames.append(frame)
+        
+        display = frame.copy()
+        for result in tracker.update(frame):
+            x, y, w, h = map(int, result['bbox'])
+            color = (0, 255, 0) if result['identified'] else (0, 0, 255)
+            label = result['student_info']['name'] if result['identified'] else 'Unknown'
+            cv2.rectangle(display, (x, y), (x + w, y + h), color, 2)
+            cv2.putText(display, label, (x, max(0, y - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        cv2.imshow('Professional Face Recognition', display)
         key = cv2.waitKey(1) & 0xFF
         
         if key == ord(' '):
-            # Identify students
-            results = recognizer.identify_student(frame, student_db)
+            # Identify students across the buffered frames, keeping each
+            # student's best match
+            frames = list(recent_frames)
+            best_by_student = {}
+            unknown_confidences = []
             
-            for result in results:
-                if result['identified']:
-                    student = result['student_info']
-                    print(f"✅ Identified: {student['name']} (Confidence: {result['similarity']:.3f})")
-                else:
-                    print(f"❓ Unknown student detected (Face confidence: {result['face_confidence']:.3f})")
+            for frame_i, faces in zip(frames, recognizer.detect_faces_batch(frames)):
+                for result in recognizer.identify_student(frame_i, student_db, detected_faces=faces):
+                    if result['identified']:
+                        student = result['student_info']
+                        best = best_by_student.get(student['id'])
+                        if best is None or result['similarity'] > best['similarity']:
+                            best_by_student[student['id']] = result
+                    else:
+                        unknown_confidences.append(result['face_confidence'])
+            
+            for result in best_by_student.values():
+                student = result['student_info']
+                print(f"✅ Identified: {student['name']} (Confidence: {result['similarity']:.3f})")
+            if unknown_confidences and not best_by_student:
+                print(f"❓ Unknown student detected (Face confidence: {max(unknown_confidences):.3f})")
+            
+            recent_frames.clear()
         
         elif key == 27:  # ESC
             break
     
+    stop_capture.set()
+    capture_thread.join(timeout=1)
     cap.release()
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
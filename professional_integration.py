@@ -7,11 +7,12 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from professional_face_recognition import ProfessionalFaceRecognizer, create_student_database_from_sqlite
+from professional_face_recognition import EMBEDDING_VERSION, get_recognizer, create_student_database_from_sqlite
 import cv2
 import numpy as np
 from flask import Flask, request, jsonify
 import sqlite3
+import threading
 from datetime import datetime, date
 import base64
 import io
@@ -22,22 +23,53 @@ class ProfessionalAttendanceSystem:
     Professional attendance system integration
     """
     
-    def __init__(self, db_path='attendance_enhanced.db', model_path='trained_face_model.pkl'):
+    def __init__(self, db_path='attendance_enhanced.db', model_path='trained_face_model.json'):
         self.db_path = db_path
         self.model_path = model_path
-        self.face_recognizer = ProfessionalFaceRecognizer()
+        self.face_recognizer = get_recognizer()
         self.student_database = []
         
+        # One SQLite connection per thread, opened on first use
+        self._local = threading.local()
+        self._ensure_attendance_index()
+        
         # Load trained model if available
         if os.path.exists(model_path):
             self.face_recognizer.load_model(model_path)
             print("✅ Loaded trained face recognition model")
+            
+            # Stored encodings from an older embedding layout never match; recompute them
+            if self.face_recognizer.embedding_version != EMBEDDING_VERSION:
+                print("🔄 Stored face encodings use an old embedding format, regenerating...")
+                self.retrain_model()
         else:
             print("⚠️ No trained model found. Using default parameters.")
         
         # Load student database
         self.reload_student_database()
     
+    def _connection(self):
+        """This thread's cached SQLite connection (autocommit; transactions are explicit)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._local.conn = conn
+        return conn
+    
+    def _ensure_attendance_index(self):
+        """One attendance row per student per day, enforced by the database where possible"""
+        try:
+            self._connection().execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS ux_att_student_date ON attendance(student_id, date)'
+            )
+        except sqlite3.Error as e:
+            # Usually duplicate rows already present; _mark_attendance still
+            # checks for today's row itself, just without the index's guarantee
+            print(f"⚠️ Attendance index not created, remove duplicate attendance rows to add it: {e}")
+    
     def reload_student_database(self):
         """Reload student database from SQLite"""
         try:
@@ -67,27 +99,25 @@ class ProfessionalAttendanceSystem:
             # Identify students
             results = self.face_recognizer.identify_student(image, self.student_database)
             
-            # Mark attendance for identified students
+            # Mark attendance for all identified students in one transaction
+            identified = [result for result in results if result['identified']]
+            newly_marked = self._mark_attendance(
+                [(result['student_info']['id'], result['similarity']) for result in identified],
+                method
+            )
+            
             attendance_results = []
-            for result in results:
-                if result['identified']:
-                    student_info = result['student_info']
-                    
-                    # Mark attendance in database
-                    attendance_success = self._mark_attendance(
-                        student_info['id'],
-                        result['similarity'],
-                        method
-                    )
-                    
-                    attendance_results.append({
-                        'student_id': student_info['id'],
-                        'student_name': student_info['name'],
-                        'roll_number': student_info['roll_number'],
-                        'similarity': result['similarity'],
-                        'bbox': result['bbox'],
-                        'attendance_marked': attendance_success
-                    })
+            for result in identified:
+                student_info = result['student_info']
+                
+                attendance_results.append({
+                    'student_id': student_info['id'],
+                    'student_name': student_info['name'],
+                    'roll_number': student_info['roll_number'],
+                    'similarity': result['similarity'],
+                    'bbox': result['bbox'].tolist(),
+                    'attendance_marked': student_info['id'] in newly_marked
+                })
             
             return {
                 'success': True,
@@ -130,36 +160,42 @@ class ProfessionalAttendanceSystem:
             print(f"❌ Image processing error: {e}")
             return None
     
-    def _mark_attendance(self, student_id, confidence, method):
-        """Mark attendance in database"""
+    def _mark_attendance(self, marks, method):
+        """Mark attendance for (student_id, confidence) pairs; returns the ids newly marked today"""
+        newly_marked = set()
+        if not marks:
+            return newly_marked
+        
+        conn = self._connection()
+        now = datetime.now()
+        today = date.today().isoformat()
+        time_in = now.time().isoformat()
+        created_at = now.isoformat(' ')
+        
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn.execute('BEGIN')
             cursor = conn.cursor()
             
-            # Check if already marked today
-            today = date.today()
-            cursor.execute('''
-                SELECT id FROM attendance 
-                WHERE student_id = ? AND date = ?
-            ''', (student_id, today))
-            
-            if cursor.fetchone():
-                conn.close()
-                return False  # Already marked
+            # Students already marked today are skipped by the NOT EXISTS check,
+            # which also covers databases where the unique index could not be created
+            for student_id, confidence in marks:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO attendance (student_id, date, time_in, method, confidence_score, created_at)
+                    SELECT ?, ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (SELECT 1 FROM attendance WHERE student_id = ? AND date = ?)
+                ''', (student_id, today, time_in, method, confidence, created_at, student_id, today))
+                if cursor.rowcount == 1:
+                    newly_marked.add(student_id)
             
-            # Mark new attendance
-            cursor.execute('''
-                INSERT INTO attendance (student_id, date, time_in, method, confidence_score, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (student_id, today, datetime.now().time(), method, confidence, datetime.now()))
-            
-            conn.commit()
-            conn.close()
-            return True
+            conn.execute('COMMIT')
             
         except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
             print(f"❌ Attendance marking error: {e}")
-            return False
+            return set()
+        
+        return newly_marked
     
     def add_student_with_photo(self, student_data, photo_data):
         """
@@ -181,7 +217,7 @@ class ProfessionalAttendanceSystem:
                 return {'success': False, 'error': 'No face detected in photo'}
             
             # Generate high-quality embedding
-            embedding = self.face_recognizer.generate_ensemble_embedding(faces[0]['face_region'])
+            embedding = self.face_recognizer.generate_ensemble_embedding(faces[0].face_region, faces[0].face_landmarks)
             
             if embedding is None:
                 return {'success': False, 'error': 'Failed to generate face embedding'}
@@ -207,7 +243,7 @@ class ProfessionalAttendanceSystem:
                 student_data.get('address', ''),
                 photo_data,
                 embedding.astype(np.float32).tobytes(),
-                faces[0]['confidence'],
+                faces[0].confidence,
                 1,  # is_active
                 datetime.now()
             ))
@@ -222,7 +258,7 @@ class ProfessionalAttendanceSystem:
             return {
                 'success': True,
                 'student_id': student_id,
-                'face_confidence': faces[0]['confidence'],
+                'face_confidence': faces[0].confidence,
                 'embedding_quality': float(np.linalg.norm(embedding))
             }
             
@@ -260,7 +296,18 @@ class ProfessionalAttendanceSystem:
             # Train model
             training_results = self.face_recognizer.train_on_student_data(student_data)
             
-            # Save trained model
+            # Store the new embeddings, then the model (which records their version)
+            conn = sqlite3.connect(self.db_path)
+            with conn:
+                conn.executemany(
+                    'UPDATE student SET face_encoding = ? WHERE id = ?',
+                    [
+                        (student['embedding'].astype(np.float32).tobytes(), student_id)
+                        for student_id, student in training_results['student_embeddings'].items()
+                    ]
+                )
+            conn.close()
+            
             self.face_recognizer.save_model(self.model_path)
             
             # Reload student database with new embeddings
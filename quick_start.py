@@ -76,7 +76,7 @@ This professional system uses:
         print("   ❌ Database not found")
     
     # Check trained model
-    if os.path.exists('trained_face_model.pkl'):
+    if os.path.exists('trained_face_model.json'):
         print("   ✅ Trained model exists")
     else:
         print("   ⚠️ No trained model (will use defaults)")
@@ -103,7 +103,7 @@ This professional system uses:
                 print("2. Run: python setup_professional.py")
                 print("3. Run: python train_face_model.py")
             
-            elif photo_count > 0 and not os.path.exists('trained_face_model.pkl'):
+            elif photo_count > 0 and not os.path.exists('trained_face_model.json'):
                 print("1. 🎓 Train the model: python train_face_model.py")
                 print("2. 🧪 Test system: python professional_integration.py")
                 print("3. 🚀 Deploy in production")
@@ -45,6 +45,15 @@ def create_database_directly():
         )
     ''')
     
+    # One attendance row per student per day; marking also checks for an existing row
+    try:
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_att_student_date
+            ON attendance(student_id, date)
+        ''')
+    except sqlite3.IntegrityError as e:
+        print(f"⚠️ Duplicate attendance rows; unique index not created until they are removed: {e}")
+    
     # Create daily_code table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS daily_code (
@@ -28,15 +28,6 @@ def install_requirements():
         print("Installing facenet-pytorch...")
         subprocess.check_call([sys.executable, "-m", "pip", "install", "facenet-pytorch"])
         
-        # Try to install dlib (may require Visual Studio Build Tools on Windows)
-        print("Installing dlib (may take a while)...")
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "dlib"])
-            print("✅ Dlib installed successfully")
-        except subprocess.CalledProcessError:
-            print("⚠️ Dlib installation failed. Some features may not work optimally.")
-            print("   Install Visual Studio Build Tools for full functionality.")
-        
         print("✅ All packages installed successfully!")
         
     except Exception as e:
@@ -7,7 +7,7 @@ import sqlite3
 import numpy as np
 import cv2
 import os
-from mediapipe_face_recognition import MediaPipeFaceRecognition
+from mediapipe_face_recognition import MediaPipeFaceRecognition, FaceDB
 
 def test_face_recognition():
     """Test face recognition against database students"""
@@ -29,7 +29,7 @@ def test_face_recognition():
     known_faces = []
     for row in student_rows:
         try:
-            encoding = np.frombuffer(row[3], dtype=np.float64)  # Fixed: use float64
+            encoding = np.frombuffer(row[3], dtype=np.float32)  # Stored as raw float32 bytes
             known_faces.append({
                 'id': row[0],
                 'name': row[1],
@@ -87,7 +87,7 @@ def test_face_recognition():
     
     # Perform face recognition
     print("\n🔍 Analyzing image...")
-    identified_faces = face_rec.identify_faces(image, known_faces)
+    identified_faces = face_rec.identify_faces(image, FaceDB(known_faces))
     
     print(f"📊 Results: {len(identified_faces)} faces detected")
     
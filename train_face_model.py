@@ -8,7 +8,7 @@ import sys
 import sqlite3
 import cv2
 import numpy as np
-from professional_face_recognition import ProfessionalFaceRecognizer
+from professional_face_recognition import get_recognizer
 import json
 from datetime import datetime
 import matplotlib.pyplot as plt
@@ -23,7 +23,7 @@ class StudentAttendanceModelTrainer:
     
     def __init__(self, db_path='attendance_enhanced.db'):
         self.db_path = db_path
-        self.face_recognizer = ProfessionalFaceRecognizer()
+        self.face_recognizer = get_recognizer()
         self.training_data = []
         self.validation_data = []
         self.student_embeddings = {}
@@ -240,7 +240,7 @@ class StudentAttendanceModelTrainer:
                 
                 faces = self.face_recognizer.detect_faces(image)
                 if faces:
-                    embedding = self.face_recognizer.generate_ensemble_embedding(faces[0]['face_region'])
+                    embedding = self.face_recognizer.generate_ensemble_embedding(faces[0].face_region, faces[0].face_landmarks)
                     if embedding is not None:
                         student_db.append({
                             'id': student['id'],
@@ -423,7 +423,7 @@ def main():
     
     # Save trained model
     print("\n6. Saving trained model...")
-    trainer.face_recognizer.save_model('trained_face_model.pkl')
+    trainer.face_recognizer.save_model('trained_face_model.json')
     
     print("\n✅ Training pipeline complete!")
     print(f"   Final model accuracy: {validation_results['accuracy']:.3f}")